@@ -1,17 +1,23 @@
 import gradio as gr
 import os
+import asyncio
+import time
+import threading
+from enum import Enum
 from pathlib import Path
 from typing import List, Tuple
 import json
+from string import Template
 from datetime import datetime
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
-from rag_engine import RAGEngine
 from utils import (
     setup_logging, 
     get_directory_info, 
     validate_file_upload,
     format_sources,
-    save_chat_history,
+    append_chat_turn,
     create_system_info,
     check_system_requirements,
     estimate_processing_time
@@ -22,21 +28,162 @@ import config
 # Setup logging
 setup_logging()
 
-# Global RAG engine instance
+# Lowercased extension set for O(1) membership checks
+_SUPPORTED_EXTS = frozenset(ext.lower() for ext in config.SUPPORTED_EXTENSIONS)
+
+# Global RAG engine instance (heavy ML modules are imported on first initialization
+# so the Gradio UI can start without waiting for them)
 rag_engine = None
 
-# Chat history storage
-chat_history = []
+# Chat history storage: recent turns in memory, every turn appended to a JSONL log
+chat_history = deque(maxlen=config.MAX_CHAT_HISTORY)
+
+# Paraphrase-tolerant cache in front of the exact-match response cache,
+# created together with the RAG engine
+semantic_cache = None
+
+# Exact-match LRU cache of (response, relevant_docs) keyed by question and model setup
+_response_cache = OrderedDict()
+
+def _response_cache_key(question: str) -> tuple:
+    """Build the exact-match cache key.
+
+    The model path and temperature are part of the key so that a configuration
+    change never serves answers produced by another model setup.
+    """
+    return (
+        question,
+        config.LLAMA_CPP_CONFIG["model_path"],
+        config.LLAMA_CPP_CONFIG["temperature"]
+    )
+
+def _get_cached_response(key: tuple):
+    """Return a cached (response, relevant_docs) pair, or None"""
+    if key not in _response_cache:
+        return None
+    _response_cache.move_to_end(key)
+    return _response_cache[key]
+
+def _put_cached_response(key: tuple, value: tuple):
+    """Store a (response, relevant_docs) pair, evicting the oldest entry if full"""
+    _response_cache[key] = value
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > config.RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+def clear_response_cache():
+    """Clear the in-process LLM response cache"""
+    _response_cache.clear()
+    if semantic_cache is not None:
+        semantic_cache.clear()
+    return "✅ Response cache cleared."
+
+# Short-lived cached values keyed by name: (computed at, value)
+_ttl_cache = {}
+
+def _cached_value(name: str, ttl_seconds: float, producer):
+    """Return ``producer()``, recomputed at most every ``ttl_seconds``"""
+    now = time.time()
+    entry = _ttl_cache.get(name)
+    if entry is None or now - entry[0] > ttl_seconds:
+        entry = (now, producer())
+        _ttl_cache[name] = entry
+    return entry[1]
+
+def _cached_json(name: str, producer) -> str:
+    """Return ``json.dumps(producer())``, recomputed at most every SYSINFO_CACHE_SECONDS"""
+    return _cached_value(name, config.SYSINFO_CACHE_SECONDS, lambda: json.dumps(producer(), indent=2))
+
+def _get_sysinfo_json() -> str:
+    """Serialized system configuration for the System Information tab"""
+    return _cached_json("sysinfo", create_system_info)
+
+def _get_requirements_json() -> str:
+    """Serialized requirements check for the System Setup tab"""
+    return _cached_json("requirements", check_system_requirements)
+
+# Precompute the configuration panel once at startup
+_get_sysinfo_json()
+
+# System status panel templates
+_STATUS_TEMPLATE = Template("""
+🕒 **Status as of:** $timestamp
+
+🤖 **RAG System:**
+- Initialization: $init_state
+- Initialized: $rag_initialized
+- Model loaded: $model_loaded
+- Index created: $index_created
+
+📊 **Index Information:**
+- Status: $status
+- Document count: $document_count
+- Vector store: $vector_store_type
+- Embedding model: $embedding_model
+
+⚙️ **Configuration:**
+- Chunk size: $chunk_size
+- Chunk overlap: $chunk_overlap
+- Max file size: $max_file_size_mb MB
+""")
+
+_MODEL_STATUS_TEMPLATE = Template("""
+
+🔧 **Model Information:**
+- Model file exists: $file_exists
+- Model size: $file_size_mb MB
+- Context size: $n_ctx
+- Vocabulary size: $n_vocab
+""")
+
+def _check_mark(value) -> str:
+    return "✅" if value else "❌"
+
+class InitState(Enum):
+    """Lifecycle of the RAG system initialization"""
+    NOT_STARTED = "Not started"
+    IN_PROGRESS = "In progress"
+    READY = "Ready"
+    FAILED = "Failed"
+
+# Initialization may be triggered by the launch-time background thread and by
+# the "Initialize System" button; the lock makes the second caller wait for the
+# in-flight run and reuse its result
+_init_lock = threading.Lock()
+_init_state = InitState.NOT_STARTED
+_init_result = None
 
 def initialize_rag_system():
-    """Initialize the RAG system"""
-    global rag_engine
+    """Initialize the RAG system (once; later calls return the cached result)"""
+    global _init_state, _init_result
+    
+    with _init_lock:
+        if _init_state is InitState.READY:
+            return _init_result
+        
+        _init_state = InitState.IN_PROGRESS
+        _init_result = _initialize_rag_system()
+        _init_state = InitState.READY if _init_result[1] else InitState.FAILED
+        return _init_result
+
+def _initialize_rag_system():
+    """Create the RAG engine and load the model and index"""
+    global rag_engine, semantic_cache
     
     try:
         logger.info("Initializing RAG system...")
-        rag_engine = RAGEngine()
+        from rag_engine import RAGEngine
+        from semantic_cache import SemanticCache
         
-        if rag_engine.initialize_system():
+        if semantic_cache is None:
+            semantic_cache = SemanticCache()
+        
+        # Handlers only check `rag_engine`, so publish the engine once it is
+        # fully initialized; a failed attempt never becomes visible to them
+        engine = RAGEngine()
+        
+        if engine.initialize_system():
+            rag_engine = engine
             return "✅ RAG system initialized successfully!", True
         else:
             return "❌ Failed to initialize RAG system. Check logs for details.", False
@@ -58,7 +205,7 @@ def process_directory(directory_path: str):
     try:
         # Get directory info first
         dir_info = get_directory_info(directory_path)
-        info_text = f"""
+        info_parts = [f"""
 📁 **Directory Information:**
 - Path: {dir_info['path']}
 - Total files: {dir_info['total_files']}
@@ -66,17 +213,20 @@ def process_directory(directory_path: str):
 - Total size: {dir_info.get('total_size_formatted', 'Unknown')}
 
 📋 **File types found:**
-"""
-        for ext, count in dir_info.get('file_types', {}).items():
-            supported = "✅" if ext in config.SUPPORTED_EXTENSIONS else "❌"
-            info_text += f"- {ext}: {count} files {supported}\n"
+"""]
+        info_parts.extend(
+            f"- {ext}: {count} files {'✅' if ext.lower() in _SUPPORTED_EXTS else '❌'}\n"
+            for ext, count in dir_info.get('file_types', {}).items()
+        )
+        info_text = "".join(info_parts)
         
         if dir_info['supported_files'] == 0:
             return "⚠️ No supported files found in directory", info_text, ""
         
         # Process directory
         logger.info(f"Processing directory: {directory_path}")
-        rag_engine.process_and_add_directory(directory_path)
+        rag_engine.process_and_add_directory_parallel(directory_path)
+        clear_response_cache()
         
         # Get updated stats
         index_stats = rag_engine.get_index_stats()
@@ -96,62 +246,98 @@ def process_directory(directory_path: str):
         logger.error(f"Error processing directory: {str(e)}")
         return f"❌ Error processing directory: {str(e)}", "", ""
 
-def process_uploaded_files(files):
-    """Process uploaded files"""
+def _process_single_upload(file):
+    """Validate and extract one uploaded file.
+
+    Returns a ``(file_info, documents, error)`` tuple; errors are captured so
+    one bad file does not fail the whole upload batch.
+    """
+    try:
+        # Validate file
+        validation = validate_file_upload(file.name)
+        
+        if not validation["valid"]:
+            return None, [], ', '.join(validation['errors'])
+        
+        # Process file
+        documents = rag_engine.document_processor.process_uploaded_file(file)
+        return validation["info"], documents, None
+        
+    except Exception as e:
+        return None, [], str(e)
+
+def _upload_summary(processed_count: int, error_count: int, total_size: int, processing_info: List[str]) -> str:
+    """Format the upload processing summary"""
+    return f"""
+📋 **Processing Summary:**
+- Files processed: {processed_count}
+- Errors: {error_count}
+- Total size: {total_size / (1024*1024):.1f} MB
+
+📄 **File Details:**
+""" + "\n".join(processing_info)
+
+async def process_uploaded_files(files):
+    """Process uploaded files, streaming progress as each file finishes"""
     global rag_engine
     
     if not rag_engine:
-        return "❌ RAG system not initialized", ""
+        yield "❌ RAG system not initialized", ""
+        return
     
     if not files:
-        return "❌ No files uploaded", ""
+        yield "❌ No files uploaded", ""
+        return
     
     try:
         processed_count = 0
         error_count = 0
         total_size = 0
         processing_info = []
+        all_documents = []
         
-        for file in files:
-            try:
-                # Validate file
-                validation = validate_file_upload(file.name)
+        # Extract files concurrently, then index everything in a single batch
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=min(config.MAX_INGEST_WORKERS, len(files))) as executor:
+            async def run_upload(file):
+                return file, await loop.run_in_executor(executor, _process_single_upload, file)
+            
+            for completed, next_result in enumerate(asyncio.as_completed([run_upload(file) for file in files]), 1):
+                file, (file_info, documents, error) = await next_result
                 
-                if not validation["valid"]:
+                if error:
                     error_count += 1
-                    processing_info.append(f"❌ {Path(file.name).name}: {', '.join(validation['errors'])}")
-                    continue
-                
-                # Get file info
-                file_info = validation["info"]
-                total_size += file_info["size"]
-                
-                # Process file
-                documents = rag_engine.document_processor.process_uploaded_file(file)
-                
-                if documents:
-                    rag_engine.add_documents(documents)
-                    processed_count += 1
-                    processing_info.append(f"✅ {file_info['name']}: {len(documents)} chunks ({file_info['size_formatted']})")
+                    processing_info.append(f"❌ {Path(file.name).name}: {error}")
                 else:
-                    error_count += 1
-                    processing_info.append(f"⚠️ {file_info['name']}: No content extracted")
+                    total_size += file_info["size"]
                     
-            except Exception as e:
-                error_count += 1
-                processing_info.append(f"❌ {Path(file.name).name}: {str(e)}")
+                    if documents:
+                        all_documents.extend(documents)
+                        processed_count += 1
+                        processing_info.append(f"✅ {file_info['name']}: {len(documents)} chunks ({file_info['size_formatted']})")
+                    else:
+                        error_count += 1
+                        processing_info.append(f"⚠️ {file_info['name']}: No content extracted")
+                
+                yield (
+                    _upload_summary(processed_count, error_count, total_size, processing_info),
+                    f"⏳ Extracted {completed}/{len(files)} files..."
+                )
+        
+        if all_documents:
+            yield (
+                _upload_summary(processed_count, error_count, total_size, processing_info),
+                f"⏳ Indexing {len(all_documents)} chunks..."
+            )
+            await rag_engine.aadd_documents(all_documents)
         
         # Create summary
-        summary = f"""
-📋 **Processing Summary:**
-- Files processed: {processed_count}
-- Errors: {error_count}
-- Total size: {total_size / (1024*1024):.1f} MB
-
-📄 **File Details:**
-""" + "\n".join(processing_info)
+        summary = _upload_summary(processed_count, error_count, total_size, processing_info)
         
         if processed_count > 0:
+            # New documents may change answers to previously asked questions
+            clear_response_cache()
+            
             # Get updated stats
             index_stats = rag_engine.get_index_stats()
             summary += f"""
@@ -161,30 +347,68 @@ def process_uploaded_files(files):
 - Status: {index_stats.get('status', 'Unknown')}
 """
         
-        return summary, f"✅ Processed {processed_count} files successfully!"
+        yield summary, f"✅ Processed {processed_count} files successfully!"
         
     except Exception as e:
         logger.error(f"Error processing uploaded files: {str(e)}")
-        return f"❌ Error processing files: {str(e)}", ""
+        yield f"❌ Error processing files: {str(e)}", ""
+
+def _compact_sources(relevant_docs: List[dict]) -> List[dict]:
+    """Reduce retrieved documents to identifiers and a short snippet for the chat log"""
+    compact = []
+    for doc in relevant_docs:
+        metadata = doc.get("metadata", {})
+        compact.append({
+            "file_name": metadata.get("file_name", "Unknown"),
+            "chunk_id": metadata.get("chunk_id", ""),
+            "score": doc.get("score", 0.0),
+            "snippet": doc.get("content", "")[:200]
+        })
+    return compact
 
 def chat_with_rag(message: str, history: List[Tuple[str, str]]):
-    """Chat with the RAG system"""
+    """Chat with the RAG system, streaming the answer as it is generated"""
     global rag_engine, chat_history
     
     if not rag_engine or not rag_engine.query_engine:
-        return history + [(message, "❌ RAG system not initialized or no documents loaded. Please add documents first.")]
+        yield history + [(message, "❌ RAG system not initialized or no documents loaded. Please add documents first.")]
+        return
     
     if not message.strip():
-        return history + [(message, "Please enter a question.")]
+        yield history + [(message, "Please enter a question.")]
+        return
     
     try:
         logger.info(f"Processing chat query: {message}")
-        
-        # Query the RAG system
-        response = rag_engine.query(message)
-        
-        # Get relevant sources
-        relevant_docs = rag_engine.get_relevant_documents(message, top_k=3)
+        question = message.strip()
+        cache_key = _response_cache_key(question)
+        
+        # Identical questions are served from the exact-match cache, and
+        # paraphrases of earlier questions from the semantic cache
+        cached = _get_cached_response(cache_key)
+        query_embedding = None
+        if cached is None:
+            query_embedding = rag_engine.embedding_model.get_query_embedding(question)
+            cached = semantic_cache.get(query_embedding)
+        
+        if cached:
+            response, relevant_docs = cached
+        else:
+            # Sources come from the query's own retrieval step
+            token_stream, relevant_docs = rag_engine.stream_query(question, top_k=3,
+                                                                  query_embedding=query_embedding)
+            
+            # Stream tokens to the chatbot as they arrive
+            response = ""
+            for chunk in token_stream:
+                response += chunk
+                yield history + [(message, response)]
+            
+            # Failed generations raise before this point, so only complete
+            # answers are cached
+            if response:
+                _put_cached_response(cache_key, (response, relevant_docs))
+                semantic_cache.put(query_embedding, question, response, relevant_docs)
         
         # Format response with sources
         if relevant_docs:
@@ -198,19 +422,18 @@ def chat_with_rag(message: str, history: List[Tuple[str, str]]):
             "timestamp": datetime.now().isoformat(),
             "question": message,
             "response": response,
-            "sources": relevant_docs
+            "sources": _compact_sources(relevant_docs)
         }
         chat_history.append(chat_entry)
+        append_chat_turn(chat_entry)
         
         # Update gradio history
-        new_history = history + [(message, full_response)]
-        
-        return new_history
+        yield history + [(message, full_response)]
         
     except Exception as e:
         logger.error(f"Error in chat: {str(e)}")
         error_response = f"❌ Error processing your question: {str(e)}"
-        return history + [(message, error_response)]
+        yield history + [(message, error_response)]
 
 def get_system_status():
     """Get current system status"""
@@ -228,46 +451,39 @@ def get_system_status():
             status_info["model_loaded"] = rag_engine.model_setup is not None
             status_info["index_created"] = rag_engine.index is not None
             
-            # Get index stats
-            index_stats = rag_engine.get_index_stats()
+            # Get index stats (briefly cached; they query the vector store)
+            index_stats = _cached_value("index_stats", config.STATUS_CACHE_SECONDS, rag_engine.get_index_stats)
             status_info.update(index_stats)
             
-            # Get model info
+            # Get model info (briefly cached; it stats the model file)
             if rag_engine.model_setup:
-                model_info = rag_engine.model_setup.get_model_info()
+                model_info = _cached_value("model_info", config.STATUS_CACHE_SECONDS, rag_engine.model_setup.get_model_info)
                 status_info["model_info"] = model_info
         
         # Format for display
-        status_text = f"""
-🕒 **Status as of:** {status_info['timestamp']}
-
-🤖 **RAG System:**
-- Initialized: {"✅" if status_info['rag_initialized'] else "❌"}
-- Model loaded: {"✅" if status_info['model_loaded'] else "❌"}
-- Index created: {"✅" if status_info['index_created'] else "❌"}
-
-📊 **Index Information:**
-- Status: {status_info.get('status', 'Unknown')}
-- Document count: {status_info.get('document_count', 'Unknown')}
-- Vector store: {status_info.get('vector_store_type', 'Unknown')}
-- Embedding model: {status_info.get('embedding_model', 'Unknown')}
-
-⚙️ **Configuration:**
-- Chunk size: {status_info.get('chunk_size', config.CHUNK_SIZE)}
-- Chunk overlap: {status_info.get('chunk_overlap', config.CHUNK_OVERLAP)}
-- Max file size: {config.MAX_FILE_SIZE_MB} MB
-"""
+        status_text = _STATUS_TEMPLATE.substitute(
+            timestamp=status_info['timestamp'],
+            init_state=_init_state.value,
+            rag_initialized=_check_mark(status_info['rag_initialized']),
+            model_loaded=_check_mark(status_info['model_loaded']),
+            index_created=_check_mark(status_info['index_created']),
+            status=status_info.get('status', 'Unknown'),
+            document_count=status_info.get('document_count', 'Unknown'),
+            vector_store_type=status_info.get('vector_store_type', 'Unknown'),
+            embedding_model=status_info.get('embedding_model', 'Unknown'),
+            chunk_size=status_info.get('chunk_size', config.CHUNK_SIZE),
+            chunk_overlap=status_info.get('chunk_overlap', config.CHUNK_OVERLAP),
+            max_file_size_mb=config.MAX_FILE_SIZE_MB
+        )
         
         if "model_info" in status_info:
             model_info = status_info["model_info"]
-            status_text += f"""
-
-🔧 **Model Information:**
-- Model file exists: {"✅" if model_info.get('file_exists') else "❌"}
-- Model size: {model_info.get('file_size_mb', 0):.1f} MB
-- Context size: {model_info.get('n_ctx', 'Unknown')}
-- Vocabulary size: {model_info.get('n_vocab', 'Unknown')}
-"""
+            status_text += _MODEL_STATUS_TEMPLATE.substitute(
+                file_exists=_check_mark(model_info.get('file_exists')),
+                file_size_mb=f"{model_info.get('file_size_mb', 0):.1f}",
+                n_ctx=model_info.get('n_ctx', 'Unknown'),
+                n_vocab=model_info.get('n_vocab', 'Unknown')
+            )
         
         return status_text
         
@@ -276,21 +492,13 @@ def get_system_status():
         return f"❌ Error getting system status: {str(e)}"
 
 def save_current_chat_history():
-    """Save current chat history"""
+    """Report where the chat history is saved (turns are appended as they happen)"""
     global chat_history
     
-    try:
-        if not chat_history:
-            return "No chat history to save."
-        
-        filepath = save_chat_history(chat_history)
-        if filepath:
-            return f"✅ Chat history saved to: {filepath}"
-        else:
-            return "❌ Failed to save chat history."
-            
-    except Exception as e:
-        return f"❌ Error saving chat history: {str(e)}"
+    if not chat_history:
+        return "No chat history to save."
+    
+    return f"✅ Chat history saved to: {config.CHAT_LOG_PATH}"
 
 def create_gradio_interface():
     """Create the Gradio interface"""
@@ -345,7 +553,7 @@ def create_gradio_interface():
                 )
                 
                 req_button.click(
-                    fn=lambda: json.dumps(check_system_requirements(), indent=2),
+                    fn=_get_requirements_json,
                     outputs=req_output
                 )
             
@@ -385,7 +593,8 @@ def create_gradio_interface():
                         process_dir_button.click(
                             fn=process_directory,
                             inputs=directory_input,
-                            outputs=[dir_status, dir_info, dir_stats]
+                            outputs=[dir_status, dir_info, dir_stats],
+                            concurrency_limit=config.GRADIO_CONFIG["ingest_concurrency_limit"]
                         )
                     
                     # File upload
@@ -413,7 +622,8 @@ def create_gradio_interface():
                         process_files_button.click(
                             fn=process_uploaded_files,
                             inputs=file_upload,
-                            outputs=[upload_details, upload_status]
+                            outputs=[upload_details, upload_status],
+                            concurrency_limit=config.GRADIO_CONFIG["ingest_concurrency_limit"]
                         )
                 
                 # Supported formats info
@@ -451,6 +661,7 @@ def create_gradio_interface():
                 with gr.Row():
                     clear_button = gr.Button("Clear Chat")
                     save_chat_button = gr.Button("Save Chat History")
+                    clear_cache_button = gr.Button("Clear LLM Cache")
                 
                 save_status = gr.Textbox(
                     label="Save Status",
@@ -460,7 +671,8 @@ def create_gradio_interface():
                 
                 # Event handlers for chat
                 def submit_message(message, history):
-                    return chat_with_rag(message, history), ""
+                    for new_history in chat_with_rag(message, history):
+                        yield new_history, ""
                 
                 submit_button.click(
                     fn=submit_message,
@@ -483,6 +695,11 @@ def create_gradio_interface():
                     fn=save_current_chat_history,
                     outputs=save_status
                 )
+                
+                clear_cache_button.click(
+                    fn=clear_response_cache,
+                    outputs=save_status
+                )
             
             # System Info Tab
             with gr.Tab("ℹ️ System Information"):
@@ -490,7 +707,7 @@ def create_gradio_interface():
                 
                 config_info = gr.Textbox(
                     label="System Configuration",
-                    value=json.dumps(create_system_info(), indent=2),
+                    value=_get_sysinfo_json(),
                     lines=20,
                     interactive=False
                 )
@@ -498,7 +715,7 @@ def create_gradio_interface():
                 refresh_config_button = gr.Button("Refresh Configuration")
                 
                 refresh_config_button.click(
-                    fn=lambda: json.dumps(create_system_info(), indent=2),
+                    fn=_get_sysinfo_json,
                     outputs=config_info
                 )
         
@@ -519,6 +736,13 @@ def create_gradio_interface():
         - **UI:** Gradio
         """)
     
+    # Serialize LLM-bound events (llama.cpp decodes one stream at a time);
+    # ingestion handlers override this with their own limit
+    demo.queue(
+        default_concurrency_limit=config.GRADIO_CONFIG["default_concurrency_limit"],
+        max_size=config.GRADIO_CONFIG["queue_max_size"]
+    )
+    
     return demo
 
 def main():
@@ -526,6 +750,10 @@ def main():
     try:
         logger.info("Starting RAG Assistant application")
         
+        # Load the model in the background so it is ready by the time the
+        # user clicks "Initialize System"
+        threading.Thread(target=initialize_rag_system, daemon=True).start()
+        
         # Create Gradio interface
         demo = create_gradio_interface()
         
@@ -7,12 +7,20 @@ Provides CLI access to all RAG functionality
 import os
 import sys
 import argparse
+import atexit
 import json
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
 import readline  # For better input handling
 from loguru import logger
 
+try:
+    import orjson  # Optional fast JSON encoder
+except ImportError:
+    orjson = None
+
 # Add current directory to path
 sys.path.append(os.path.dirname(__file__))
 
@@ -25,6 +33,7 @@ class RAGCLIApp:
     
     def __init__(self):
         self.rag_engine = None
+        self.semantic_cache = None
         self.chat_history = []
         self.setup_logging()
     
@@ -43,6 +52,7 @@ class RAGCLIApp:
             self.rag_engine = RAGEngine()
             
             if self.rag_engine.initialize_system():
+                self.setup_semantic_cache()
                 print("✅ RAG system initialized successfully!")
                 return True
             else:
@@ -53,6 +63,45 @@ class RAGCLIApp:
             print(f"❌ Error initializing RAG system: {str(e)}")
             return False
     
+    def setup_semantic_cache(self):
+        """Load the persistent semantic cache of previously answered questions"""
+        from semantic_cache import SemanticCache
+        
+        self.semantic_cache = SemanticCache(
+            threshold=config.CLI_SEMCACHE_TAU,
+            ttl_seconds=config.CLI_SEMCACHE_TTL_SECONDS
+        )
+        self.semantic_cache.load(config.SEMCACHE_PATH, index_version=self.rag_engine.get_document_count())
+        # Answers are persisted once per command/session rather than per question
+        atexit.register(self.save_semantic_cache)
+    
+    def save_semantic_cache(self):
+        """Write the semantic cache to disk if it changed since it was loaded"""
+        if self.semantic_cache is not None and self.semantic_cache.dirty:
+            try:
+                # Tagged with the index size so documents added elsewhere
+                # (e.g. through the web app) invalidate the saved answers
+                self.semantic_cache.save(config.SEMCACHE_PATH, index_version=self.rag_engine.get_document_count())
+            except Exception as e:
+                logger.warning(f"Could not save semantic cache: {str(e)}")
+    
+    def cached_query(self, question: str):
+        """Query the RAG system, answering paraphrases of earlier questions from cache.
+
+        Failed queries raise, so only successful answers are cached.
+        """
+        if self.semantic_cache is None:
+            return self.rag_engine.query(question, top_k=3)
+        
+        query_embedding = self.rag_engine.embedding_model.get_query_embedding(question)
+        cached = self.semantic_cache.get(query_embedding)
+        if cached:
+            return cached
+        
+        response, relevant_docs = self.rag_engine.query(question, top_k=3, query_embedding=query_embedding)
+        self.semantic_cache.put(query_embedding, question, response, relevant_docs)
+        return response, relevant_docs
+    
     def add_documents(self, paths: List[str], recursive: bool = False):
         """Add documents from paths"""
         if not self.rag_engine:
@@ -86,31 +135,70 @@ class RAGCLIApp:
                 print(f"⚠️ Path not found: {path}")
         
         if total_docs > 0:
+            # Cached answers may be outdated once the index changes
+            if self.semantic_cache is not None:
+                self.semantic_cache.clear()
+                self.save_semantic_cache()
+            
             # Show updated stats
             stats = self.rag_engine.get_index_stats()
             print(f"\n📊 Index updated - Document count: {stats.get('document_count', 'Unknown')}")
     
+    def cached_stream_query(self, question: str) -> Tuple[Iterator[str], List[dict]]:
+        """Streaming variant of ``cached_query``; cache hits are yielded as one chunk"""
+        if self.semantic_cache is None:
+            return self.rag_engine.stream_query(question, top_k=3)
+        
+        query_embedding = self.rag_engine.embedding_model.get_query_embedding(question)
+        cached = self.semantic_cache.get(query_embedding)
+        if cached:
+            response, relevant_docs = cached
+            return iter([response]), relevant_docs
+        
+        stream, relevant_docs = self.rag_engine.stream_query(question, top_k=3, query_embedding=query_embedding)
+        return self._cache_stream(query_embedding, question, stream, relevant_docs), relevant_docs
+    
+    def _cache_stream(self, query_embedding, question: str, stream: Iterator[str],
+                      relevant_docs: List[dict]) -> Iterator[str]:
+        """Pass a token stream through, caching the full answer once it ends.
+
+        A stream that raises is never cached.
+        """
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        
+        self.semantic_cache.put(query_embedding, question, "".join(chunks), relevant_docs)
+    
     def query_single(self, question: str) -> str:
-        """Process a single query"""
+        """Process a single query, writing the answer to stdout as it is generated"""
         if not self.rag_engine or not self.rag_engine.query_engine:
-            return "❌ RAG system not initialized or no documents loaded"
+            print("\n❌ RAG system not initialized or no documents loaded")
+            return ""
         
         try:
-            response = self.rag_engine.query(question)
+            # Sources come from the query's own retrieval step
+            stream, relevant_docs = self.cached_stream_query(question)
             
-            # Get sources
-            relevant_docs = self.rag_engine.get_relevant_documents(question, top_k=3)
+            sys.stdout.write("\n🤖 Answer: ")
+            chunks = []
+            for chunk in stream:
+                chunks.append(chunk)
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
+            response = "".join(chunks)
             
-            # Format response
-            result = f"🤖 Answer: {response}\n"
+            # Format sources
+            parts = ["\n"]
             
             if relevant_docs:
-                result += f"\n📚 Sources:\n"
-                for i, doc in enumerate(relevant_docs, 1):
-                    metadata = doc.get("metadata", {})
-                    file_name = metadata.get("file_name", "Unknown")
-                    score = doc.get("score", 0.0)
-                    result += f"  {i}. {file_name} (similarity: {score:.3f})\n"
+                parts.append("\n📚 Sources:\n")
+                parts.extend(
+                    f"  {i}. {doc.get('metadata', {}).get('file_name', 'Unknown')} "
+                    f"(similarity: {doc.get('score', 0.0):.3f})\n"
+                    for i, doc in enumerate(relevant_docs, 1)
+                )
             
             # Add to chat history
             self.chat_history.append({
@@ -119,10 +207,12 @@ class RAGCLIApp:
                 "sources": relevant_docs
             })
             
-            return result
+            print("".join(parts))
+            return response
             
         except Exception as e:
-            return f"❌ Error processing query: {str(e)}"
+            print(f"\n❌ Error processing query: {str(e)}")
+            return ""
     
     def interactive_chat(self):
         """Start interactive chat session"""
@@ -137,6 +227,13 @@ class RAGCLIApp:
         print("Type '/save' to save chat history")
         print("-" * 50)
         
+        try:
+            self._chat_loop()
+        finally:
+            self.save_semantic_cache()
+    
+    def _chat_loop(self):
+        """Read and answer questions until the user quits"""
         while True:
             try:
                 question = input("\n🗣️ You: ").strip()
@@ -154,8 +251,7 @@ class RAGCLIApp:
                     continue
                 
                 print("\n🤔 Processing...")
-                response = self.query_single(question)
-                print(f"\n{response}")
+                self.query_single(question)
                 
             except KeyboardInterrupt:
                 print("\n\n👋 Chat interrupted. Goodbye!")
@@ -180,9 +276,9 @@ quit/exit/q - Exit chat mode
         elif command == '/stats':
             if self.rag_engine:
                 stats = self.rag_engine.get_index_stats()
-                print("\n📊 System Statistics:")
-                for key, value in stats.items():
-                    print(f"  {key}: {value}")
+                lines = ["\n📊 System Statistics:"]
+                lines.extend(f"  {key}: {value}" for key, value in stats.items())
+                print("\n".join(lines))
             else:
                 print("❌ RAG system not initialized")
         
@@ -209,78 +305,114 @@ quit/exit/q - Exit chat mode
             print(f"❌ Unknown command: {command}")
             print("Type '/help' for available commands")
     
-    def batch_query(self, questions_file: str, output_file: Optional[str] = None):
+    def _answer_question(self, question: str) -> dict:
+        """Answer one batch question, capturing errors in the result"""
+        try:
+            response, sources = self.cached_query(question)
+            
+            return {
+                "question": question,
+                "response": response,
+                "sources": [
+                    {
+                        "file_name": src.get("metadata", {}).get("file_name", "Unknown"),
+                        "score": src.get("score", 0.0)
+                    } for src in sources
+                ]
+            }
+            
+        except Exception as e:
+            print(f"❌ Error processing question '{question[:50]}': {str(e)}")
+            return {
+                "question": question,
+                "response": f"Error: {str(e)}",
+                "sources": []
+            }
+    
+    @staticmethod
+    def _iter_questions(questions_file: str):
+        """Yield non-empty, stripped lines from a questions file"""
+        with open(questions_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                question = line.strip()
+                if question:
+                    yield question
+    
+    def batch_query(self, questions_file: str, output_file: Optional[str] = None, concurrency: int = 4):
         """Process batch queries from file"""
         if not self.rag_engine or not self.rag_engine.query_engine:
             print("❌ RAG system not initialized or no documents loaded")
             return
         
         try:
-            with open(questions_file, 'r', encoding='utf-8') as f:
-                questions = [line.strip() for line in f.readlines() if line.strip()]
-            
-            results = []
+            print(f"📝 Processing questions from {questions_file}")
             
-            print(f"📝 Processing {len(questions)} questions from {questions_file}")
+            # Retrieval for upcoming questions overlaps with generation of the current one
+            workers = max(1, concurrency)
+            questions = enumerate(self._iter_questions(questions_file))
+            answers = {}
             
-            for i, question in enumerate(questions, 1):
-                print(f"Processing question {i}/{len(questions)}: {question[:50]}...")
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Only a bounded window of questions is read and in flight at a time
+                pending = {
+                    executor.submit(self._answer_question, question): (i, question)
+                    for i, question in islice(questions, workers * 2)
+                }
                 
-                try:
-                    response = self.rag_engine.query(question)
-                    sources = self.rag_engine.get_relevant_documents(question, top_k=3)
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        i, question = pending.pop(future)
+                        answers[i] = future.result()
+                        print(f"Completed question {len(answers)}: {question[:50]}...")
                     
-                    result = {
-                        "question": question,
-                        "response": response,
-                        "sources": [
-                            {
-                                "file_name": src.get("metadata", {}).get("file_name", "Unknown"),
-                                "score": src.get("score", 0.0)
-                            } for src in sources
-                        ]
-                    }
-                    results.append(result)
-                    
-                except Exception as e:
-                    print(f"❌ Error processing question {i}: {str(e)}")
-                    results.append({
-                        "question": question,
-                        "response": f"Error: {str(e)}",
-                        "sources": []
-                    })
+                    for i, question in islice(questions, len(done)):
+                        pending[executor.submit(self._answer_question, question)] = (i, question)
+            
+            # Results keep the input order
+            total = len(answers)
+            results = [answers[i] for i in range(total)]
             
             # Save results
-            output_path = output_file or f"batch_results_{len(questions)}_questions.json"
+            output_path = output_file or f"batch_results_{total}_questions.json"
             
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+            if orjson is not None:
+                with open(output_path, 'wb') as f:
+                    f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+            else:
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    json.dump(results, f, indent=2, ensure_ascii=False)
             
             print(f"✅ Batch processing complete. Results saved to: {output_path}")
             
         except Exception as e:
             print(f"❌ Error in batch processing: {str(e)}")
+        
+        finally:
+            self.save_semantic_cache()
     
     def show_status(self):
         """Show system status"""
-        print("\n📊 RAG Assistant Status")
-        print("-" * 30)
+        lines = ["\n📊 RAG Assistant Status", "-" * 30]
         
         if not self.rag_engine:
-            print("❌ RAG system not initialized")
+            lines.append("❌ RAG system not initialized")
+            print("\n".join(lines))
             return
         
-        print(f"✅ RAG system initialized")
-        print(f"✅ Model loaded: {self.rag_engine.model_setup is not None}")
-        print(f"✅ Index created: {self.rag_engine.index is not None}")
+        lines.extend([
+            "✅ RAG system initialized",
+            f"✅ Model loaded: {self.rag_engine.model_setup is not None}",
+            f"✅ Index created: {self.rag_engine.index is not None}"
+        ])
         
         if self.rag_engine.index:
             stats = self.rag_engine.get_index_stats()
-            print(f"\n📈 Index Statistics:")
-            for key, value in stats.items():
-                print(f"  {key}: {value}")
+            lines.append("\n📈 Index Statistics:")
+            lines.extend(f"  {key}: {value}" for key, value in stats.items())
         
-        print(f"\n💬 Chat history: {len(self.chat_history)} messages")
+        lines.append(f"\n💬 Chat history: {len(self.chat_history)} messages")
+        print("\n".join(lines))
 
 def main():
     """Main CLI function"""
@@ -323,6 +455,7 @@ Examples:
     batch_parser = subparsers.add_parser('batch', help='Batch query processing')
     batch_parser.add_argument('input_file', help='File containing questions (one per line)')
     batch_parser.add_argument('--output', '-o', help='Output file for results')
+    batch_parser.add_argument('--concurrency', '-c', type=int, default=4, help='Questions processed concurrently')
     
     # Status command
     status_parser = subparsers.add_parser('status', help='Show system status')
@@ -356,8 +489,7 @@ Examples:
         elif args.command == 'query':
             if not app.initialize_system():
                 sys.exit(1)
-            response = app.query_single(args.question)
-            print(f"\n{response}")
+            app.query_single(args.question)
         
         elif args.command == 'chat':
             if not app.initialize_system():
@@ -367,7 +499,7 @@ Examples:
         elif args.command == 'batch':
             if not app.initialize_system():
                 sys.exit(1)
-            app.batch_query(args.input_file, args.output)
+            app.batch_query(args.input_file, args.output, args.concurrency)
         
         elif args.command == 'status':
             app.show_status()
@@ -1,40 +1,93 @@
 import os
+from functools import lru_cache
 from pathlib import Path
 
+# Pick up settings such as HUGGINGFACE_TOKEN from a local .env file
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
 # Model Configuration
 MODEL_NAME = "Akhenaton/sft_banking_model"
 MODEL_FILE = "unsloth.Q4_K_M.gguf"  # Quantized model file
 MODEL_PATH = "./models"
 HUGGINGFACE_TOKEN = os.getenv("HUGGINGFACE_TOKEN", "")
+MODEL_DOWNLOAD_WORKERS = 8  # Concurrent file downloads from the Hub
+MODEL_DOWNLOAD_RETRIES = 3  # Attempts before giving up on a transient Hub error
+
+# Optional OpenAI-compatible completion server with continuous batching, e.g.
+# `llama-server -m model.gguf --parallel 8 --cont-batching` or vLLM. When set,
+# generation goes to the server instead of the in-process llama.cpp model.
+LLM_SERVER_URL = os.getenv("LLM_SERVER_URL", "")
+LLM_SERVER_PARALLEL = 8  # Concurrent requests to send when using the server
 
 # llama.cpp Configuration
 LLAMA_CPP_CONFIG = {
     "model_path": os.path.join(MODEL_PATH, MODEL_FILE),
     "n_ctx": 4096,
-    "n_batch": 512,
-    "n_threads": 8,
+    "n_batch": 2048,  # Prompt tokens evaluated per prefill step
+    "n_threads": None,  # None = one thread per physical core
+    "numa": False,  # NUMA-aware allocation for multi-socket CPUs
+    "n_gpu_layers": -1,  # Layers offloaded to GPU (-1 = all); ignored by CPU-only builds, 0 forces CPU
+    "use_mmap": True,
+    # Pin weights in RAM so they are never paged out. Opt in with LLAMA_USE_MLOCK=1;
+    # the locked-memory limit must cover the model size (`ulimit -l unlimited` or
+    # memlock in /etc/security/limits.conf), otherwise llama.cpp only warns.
+    "use_mlock": os.getenv("LLAMA_USE_MLOCK", "").lower() in ("1", "true", "yes"),
     "temperature": 0.1,
     "top_p": 0.9,
     "top_k": 40,
     "repeat_penalty": 1.1,
     "max_tokens": 2048,
-    "verbose": False
+    "verbose": False,
+    "prompt_cache_bytes": 2 * 1024 ** 3,  # RAM reserved for cached prompt KV states
+    "run_warmup_test": False  # Generate one token after loading to page in weights
 }
 
 # Embedding Configuration
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 EMBEDDING_DIMENSION = 384
+EMBED_BATCH_SIZE = 64  # Chunks per embedding model forward pass
+EMBEDDING_DEVICE = None  # None = CUDA when available, else CPU
+EMBEDDING_FP16 = True  # Half-precision weights when running on CUDA
+MAX_CONCURRENT_BATCHES = 4  # Embedding batches in flight during async ingestion
+EMBEDDING_CACHE_PATH = "./processed_data/embedding_cache.sqlite"
 
 # Vector Store Configuration
 VECTOR_STORE_TYPE = "chroma"  # Options: chroma, faiss
 PERSIST_DIR = "./vector_store"
 COLLECTION_NAME = "document_collection"
 
+# Chroma HNSW collection metadata; only applied when the collection is created
+CHROMA_HNSW_CONFIG = {
+    "hnsw:space": "cosine",  # Matches normalized sentence-transformer embeddings
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+    "hnsw:search_ef": 100
+}
+FAISS_PERSIST_DIR = os.path.join(PERSIST_DIR, "faiss")
+
+# FAISS HNSW index parameters (used when VECTOR_STORE_TYPE = "faiss")
+FAISS_CONFIG = {
+    "M": 32,  # Graph neighbours per node
+    "ef_construction": 200,  # Candidate list size while inserting
+    "ef_search": 64  # Candidate list size while querying
+}
+EMBEDDING_QUANTIZATION = "int8"  # FAISS vector encoding: "int8" or None for float32
+
 # Document Processing Configuration
 SUPPORTED_EXTENSIONS = ['.pdf', '.docx', '.txt', '.md', '.csv', '.xlsx']
 CHUNK_SIZE = 1024
 CHUNK_OVERLAP = 200
+CHARS_PER_TOKEN = 4  # Approximation used to turn token-based chunk sizes into characters
 MAX_FILE_SIZE_MB = 50
+DIRECTORY_INFO_CACHE_SECONDS = 60  # Max age of a cached directory scan
+SCAN_STAT_WORKERS = 8  # Threads that overlap stat calls when scanning large directories
+SCAN_PARALLEL_STAT_MIN = 512  # Files needed before stats are spread over SCAN_STAT_WORKERS
+MAX_INGEST_WORKERS = 8  # Files extracted concurrently during ingestion
+MAX_PROCESS_WORKERS = os.cpu_count() or 1  # Worker processes for directory processing
 
 # Docling Configuration
 DOCLING_CONFIG = {
@@ -49,22 +102,66 @@ DOCLING_CONFIG = {
 DATA_DIR = "./data"
 PROCESSED_DATA_DIR = "./processed_data"
 LOGS_DIR = "./logs"
+CHAT_LOG_PATH = os.path.join(LOGS_DIR, "chat_history.jsonl")
+MAX_CHAT_HISTORY = 200  # Chat turns kept in memory by the web UI
 
-# Create directories if they don't exist
-for dir_path in [MODEL_PATH, DATA_DIR, PROCESSED_DATA_DIR, LOGS_DIR, PERSIST_DIR]:
+@lru_cache(maxsize=None)
+def ensure_dir(dir_path: str) -> str:
+    """Create a directory on first use and return its path"""
     Path(dir_path).mkdir(parents=True, exist_ok=True)
+    return dir_path
 
 # RAG Configuration
 RAG_CONFIG = {
     "similarity_top_k": 5,
+    # Scores are cosine similarities for every vector store and distance space
+    "similarity_cutoff": 0.82,  # Minimum cosine similarity for a retrieved chunk
+    "relative_score_cutoff": 0.85,  # Drop chunks whose cosine similarity is below this fraction of the best match
     "response_mode": "compact",
     "streaming": True
 }
 
+# Prompts: the system prompt is a fixed prefix of every query prompt so its
+# KV cache can be computed once and reused
+SYSTEM_PROMPT = (
+    "You are a helpful assistant that answers questions using only the "
+    "information in the provided documents.\n\n"
+)
+QA_PROMPT_TEMPLATE = (
+    "Context information is below.\n"
+    "---------------------\n"
+    "{context_str}\n"
+    "---------------------\n"
+    "Given the context information and not prior knowledge, answer the query.\n"
+    "Query: {query_str}\n"
+    "Answer: "
+)
+
+# Maximum number of distinct questions kept in the in-process response cache
+RESPONSE_CACHE_SIZE = 512
+STREAM_CHUNK_TOKENS = 8  # Tokens buffered per chunk by the async streaming query
+
+# Semantic cache configuration (cosine similarity over question embeddings)
+SEMCACHE_TAU = 0.85  # Minimum similarity to reuse a cached answer
+SEMCACHE_DEDUP_TAU = 0.95  # Near-identical questions update the entry in place
+SEMCACHE_TTL_SECONDS = 300
+SEMCACHE_MAX_ENTRIES = 1000
+
+# The CLI keeps a persistent semantic cache across runs, with a stricter threshold
+CLI_SEMCACHE_TAU = 0.92
+CLI_SEMCACHE_TTL_SECONDS = 24 * 60 * 60
+SEMCACHE_PATH = os.path.join(PERSIST_DIR, "sem_cache")
+
 # UI Configuration
+SYSINFO_CACHE_SECONDS = 5  # How long system info / requirements output is reused
+STATUS_CACHE_SECONDS = 2  # How long index stats / model info are reused by the status panel
 GRADIO_CONFIG = {
     "server_name": "0.0.0.0",
     "server_port": 7860,
     "share": False,
-    "debug": True
+    "debug": True,
+    # Chat and other events share the single in-process LLM; a server batches them
+    "default_concurrency_limit": LLM_SERVER_PARALLEL if LLM_SERVER_URL else 1,
+    "ingest_concurrency_limit": 4,
+    "queue_max_size": 32
 }
\ No newline at end of file
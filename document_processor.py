@@ -1,16 +1,82 @@
 import os
+import re
+import hashlib
+import contextlib
+import shutil
+import threading
+import multiprocessing
 import tempfile
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import numpy as np
 from docling.document_converter import DocumentConverter
-from docling.datamodel.base_models import InputFormat
+from docling.datamodel.base_models import DocumentStream, InputFormat
 from docling.datamodel.pipeline_options import PdfPipelineOptions
 from docling.backend.pypdfium2_backend import PyPdfiumDocumentBackend
 from llama_index.core import Document
-from llama_index.core.node_parser import SentenceSplitter
 from loguru import logger
 import config
 
+# Per-file config lookups bound once at import
+_SUPPORTED_EXTENSIONS = frozenset(ext.lower() for ext in config.SUPPORTED_EXTENSIONS)
+_MAX_FILE_SIZE_MB = config.MAX_FILE_SIZE_MB
+_MAX_FILE_SIZE_BYTES = _MAX_FILE_SIZE_MB * 1024 * 1024
+
+# Formats whose bytes are the text itself; no conversion needed
+_PLAIN_TEXT_EXTENSIONS = frozenset({'.txt', '.md'})
+
+# Docling converter shared by every DocumentProcessor in the process
+_converter = None
+_converter_lock = threading.Lock()
+
+# Per-process DocumentProcessor used by process pool workers
+_worker_processor = None
+
+def get_converter() -> DocumentConverter:
+    """Return the process-wide Docling converter, creating it on first use"""
+    global _converter
+    with _converter_lock:
+        if _converter is None:
+            # Configure pipeline options for PDF processing
+            pdf_options = PdfPipelineOptions(
+                do_ocr=config.DOCLING_CONFIG["do_ocr"],
+                do_table_structure=config.DOCLING_CONFIG["do_table_structure"],
+                table_structure_options=config.DOCLING_CONFIG.get("table_structure_options", {})
+            )
+            
+            # Create converter with PDF backend
+            _converter = DocumentConverter(
+                format_options={
+                    InputFormat.PDF: pdf_options,
+                }
+            )
+            
+            logger.info("Docling converter initialized with OCR support")
+        return _converter
+
+def _pool_context():
+    """Start workers with spawn.
+
+    By the time directories are processed the parent has usually initialized
+    CUDA (embedding model, GPU-offloaded LLM) and started logging and ingest
+    threads; forked children cannot re-initialize CUDA and can deadlock on
+    locks held by those threads.
+    """
+    return multiprocessing.get_context("spawn")
+
+def _process_one(file_path: str) -> List[Document]:
+    """Process a single file in a worker process.
+
+    Docling converters are not picklable, so each spawned worker builds its
+    own on first use and reuses it for later files.
+    """
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = DocumentProcessor()
+    return _worker_processor.process_file(file_path)
+
 class DocumentProcessor:
     """
     Document processor using Docling for various file formats including scanned PDFs
@@ -18,61 +84,102 @@ class DocumentProcessor:
     
     def __init__(self):
         self.setup_docling()
-        self.node_parser = SentenceSplitter(
-            chunk_size=config.CHUNK_SIZE,
-            chunk_overlap=config.CHUNK_OVERLAP
-        )
+        
+        # Sentence pattern compiled once: a run of non-terminators followed by
+        # terminal punctuation (or end of text). Every character belongs to
+        # exactly one match and the pattern cannot backtrack.
+        self._sentence_re = re.compile(r'[^.!?]+(?:[.!?]+\s*|$)|[.!?]+\s*')
+        # Fallback units for text without sentence punctuation (OCR output,
+        # tables, lists): lines, then words, each keeping its trailing whitespace
+        self._line_re = re.compile(r'[^\n]*\n+|[^\n]+')
+        self._word_re = re.compile(r'\s*\S+\s*')
+        
+        # CHUNK_SIZE / CHUNK_OVERLAP are expressed in tokens; chunking works in characters
+        self.chunk_chars = config.CHUNK_SIZE * config.CHARS_PER_TOKEN
+        self.overlap_chars = config.CHUNK_OVERLAP * config.CHARS_PER_TOKEN
         
     def setup_docling(self):
         """Setup Docling converter with OCR capabilities"""
-        # Configure pipeline options for PDF processing
-        pdf_options = PdfPipelineOptions(
-            do_ocr=config.DOCLING_CONFIG["do_ocr"],
-            do_table_structure=config.DOCLING_CONFIG["do_table_structure"],
-            table_structure_options=config.DOCLING_CONFIG.get("table_structure_options", {})
-        )
-        
-        # Create converter with PDF backend
-        self.converter = DocumentConverter(
-            format_options={
-                InputFormat.PDF: pdf_options,
-            }
-        )
-        
-        logger.info("Docling converter initialized with OCR support")
-    
-    def is_supported_file(self, file_path: str) -> bool:
-        """Check if file extension is supported"""
-        return Path(file_path).suffix.lower() in config.SUPPORTED_EXTENSIONS
+        self.converter = get_converter()
+    
+    def is_supported_file(self, file_path: str, ext: Optional[str] = None) -> bool:
+        """Check if file extension is supported; ``ext`` skips re-parsing the path"""
+        if ext is None:
+            ext = os.path.splitext(file_path)[1].lower()
+        return ext in _SUPPORTED_EXTENSIONS
     
     def get_file_size_mb(self, file_path: str) -> float:
         """Get file size in MB"""
         return os.path.getsize(file_path) / (1024 * 1024)
     
+    def file_digest(self, file_path: str) -> str:
+        """Hash file contents in 1 MB blocks"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
     def process_with_docling(self, file_path: str) -> str:
-        """Process document using Docling"""
+        """Process document using Docling, reusing cached text for unchanged files"""
         try:
-            # Convert document
-            result = self.converter.convert(file_path)
-            
-            # Extract text content
-            text_content = ""
-            for page in result.document.pages:
-                for element in page.elements:
-                    if hasattr(element, 'text') and element.text:
-                        text_content += element.text + "\n"
-            
-            # Also extract tables if present
-            if hasattr(result.document, 'tables') and result.document.tables:
-                for table in result.document.tables:
-                    if hasattr(table, 'data'):
-                        text_content += f"\n[TABLE]\n{table.data}\n[/TABLE]\n"
-            
-            return text_content.strip()
-            
+            cache_path = os.path.join(config.ensure_dir(config.PROCESSED_DATA_DIR), f"{self.file_digest(file_path)}.txt")
+        except OSError as e:
+            logger.warning(f"Could not hash {file_path}, skipping text cache: {str(e)}")
+            cache_path = None
+        
+        if cache_path and os.path.exists(cache_path):
+            logger.info(f"Using cached text for {file_path}")
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        
+        try:
+            text_content = self._docling_text(file_path)
         except Exception as e:
             logger.error(f"Error processing {file_path} with Docling: {str(e)}")
             return self.fallback_processing(file_path)
+        
+        if cache_path and text_content:
+            self._write_text_cache(cache_path, text_content)
+        
+        return text_content
+    
+    def _write_text_cache(self, cache_path: str, text_content: str):
+        """Store extracted text; failures are logged since the text is still usable"""
+        tmp_path = None
+        try:
+            # Unique temp file, then rename, so concurrent writers of the same
+            # content never share a temp file or expose a partial cache entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text_content)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not cache extracted text at {cache_path}: {str(e)}")
+            if tmp_path:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+    
+    def _docling_text(self, source) -> str:
+        """Convert a file path or DocumentStream with Docling and flatten it to text"""
+        # Convert document
+        result = self.converter.convert(source)
+        
+        # Extract text content
+        parts = []
+        for page in result.document.pages:
+            for element in page.elements:
+                text = getattr(element, 'text', None)
+                if text:
+                    parts.append(text)
+        
+        # Also extract tables if present
+        for table in getattr(result.document, 'tables', None) or []:
+            data = getattr(table, 'data', None)
+            if data is not None:
+                parts.append(f"\n[TABLE]\n{data}\n[/TABLE]")
+        
+        return "\n".join(parts).strip()
     
     def fallback_processing(self, file_path: str) -> str:
         """Fallback text extraction for unsupported files"""
@@ -95,14 +202,88 @@ class DocumentProcessor:
             logger.error(f"Fallback processing failed for {file_path}: {str(e)}")
             return ""
     
+    def split_text(self, text: str) -> List[str]:
+        """Split text into overlapping chunks along sentence boundaries.
+
+        Sentences are packed greedily up to ``chunk_chars``; each chunk starts
+        with the trailing sentences of the previous one, up to ``overlap_chars``.
+        Chunk boundaries are found with binary searches over the cumulative
+        sentence lengths.
+        """
+        sentences = []
+        for sentence in self._sentence_re.findall(text):
+            if len(sentence) <= self.chunk_chars:
+                sentences.append(sentence)
+            else:
+                sentences.extend(self._split_oversize(sentence))
+        
+        if not sentences:
+            return []
+        
+        lengths = np.fromiter((len(sentence) for sentence in sentences), dtype=np.int64, count=len(sentences))
+        # offsets[i] is the number of characters before sentence i
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        total = len(sentences)
+        
+        chunks = []
+        start = 0
+        while start < total:
+            end = int(np.searchsorted(offsets, offsets[start] + self.chunk_chars, side='right')) - 1
+            end = min(max(end, start + 1), total)
+            
+            chunk = "".join(sentences[start:end]).strip()
+            if chunk:
+                chunks.append(chunk)
+            
+            if end >= total:
+                break
+            
+            # Next chunk starts at the earliest sentence within the overlap window,
+            # or without overlap when the next sentence would not fit after it
+            next_start = int(np.searchsorted(offsets, offsets[end] - self.overlap_chars, side='left'))
+            if next_start <= start or offsets[end + 1] - offsets[next_start] > self.chunk_chars:
+                next_start = end
+            start = next_start
+        
+        return chunks
+    
+    def _split_oversize(self, sentence: str) -> List[str]:
+        """Break a sentence longer than ``chunk_chars`` into lines, then words.
+
+        Only a single word longer than ``chunk_chars`` is cut mid-word, into
+        overlap-sized pieces so neighbouring chunks still share context.
+        """
+        pieces = []
+        step = min(self.overlap_chars, self.chunk_chars) or self.chunk_chars
+        for line in self._line_re.findall(sentence):
+            if len(line) <= self.chunk_chars:
+                pieces.append(line)
+                continue
+            for word in self._word_re.findall(line):
+                if len(word) <= self.chunk_chars:
+                    pieces.append(word)
+                else:
+                    pieces.extend(word[start:start + step] for start in range(0, len(word), step))
+        return pieces
+    
     def process_file(self, file_path: str) -> List[Document]:
-        """Process a single file and return LlamaIndex Documents"""
-        if not self.is_supported_file(file_path):
+        """Process a single file and return LlamaIndex Documents.
+
+        Each returned Document is one final chunk and is not split again.
+        Callers must embed them together (``RAGEngine._embed_batch``) instead
+        of inserting them into the index one at a time, which would run the
+        embedding model once per chunk.
+        """
+        file_name = os.path.basename(file_path)
+        ext = os.path.splitext(file_name)[1].lower()
+        
+        if not self.is_supported_file(file_path, ext):
             logger.warning(f"Unsupported file type: {file_path}")
             return []
         
-        if self.get_file_size_mb(file_path) > config.MAX_FILE_SIZE_MB:
-            logger.warning(f"File too large: {file_path} ({self.get_file_size_mb(file_path):.2f} MB)")
+        size_mb = self.get_file_size_mb(file_path)
+        if size_mb > _MAX_FILE_SIZE_MB:
+            logger.warning(f"File too large: {file_path} ({size_mb:.2f} MB)")
             return []
         
         logger.info(f"Processing file: {file_path}")
@@ -114,36 +295,109 @@ class DocumentProcessor:
             logger.warning(f"No content extracted from {file_path}")
             return []
         
-        # Create LlamaIndex document
-        document = Document(
-            text=text_content,
-            metadata={
-                "file_path": file_path,
-                "file_name": Path(file_path).name,
-                "file_type": Path(file_path).suffix.lower(),
-                "file_size": self.get_file_size_mb(file_path)
-            }
-        )
+        # Split into chunks that share this file's metadata
+        documents = self._build_documents(text_content, {
+            "file_path": file_path,
+            "file_name": file_name,
+            "file_type": ext,
+            "file_size": size_mb
+        })
+        
+        logger.info(f"Successfully processed {file_path} into {len(documents)} chunks")
+        return documents
+    
+    def process_bytes(self, data: bytes, filename_hint: str) -> List[Document]:
+        """Process in-memory file contents without writing them to disk.
+
+        ``filename_hint`` supplies the file type and the name recorded in the
+        chunk metadata. The same batch-embed contract as ``process_file``
+        applies to the returned Documents.
+        """
+        file_name = os.path.basename(filename_hint)
+        ext = os.path.splitext(file_name)[1].lower()
+        
+        if not self.is_supported_file(filename_hint, ext):
+            logger.warning(f"Unsupported file type: {filename_hint}")
+            return []
+        
+        size_mb = len(data) / (1024 * 1024)
+        if size_mb > _MAX_FILE_SIZE_MB:
+            logger.warning(f"File too large: {filename_hint} ({size_mb:.2f} MB)")
+            return []
+        
+        logger.info(f"Processing in-memory file: {filename_hint}")
+        
+        if ext in _PLAIN_TEXT_EXTENSIONS:
+            text_content = data.decode('utf-8', errors='replace').strip()
+        else:
+            try:
+                text_content = self._docling_text(DocumentStream(name=file_name, stream=BytesIO(data)))
+            except Exception as e:
+                logger.error(f"Error processing {filename_hint} with Docling: {str(e)}")
+                return []
+        
+        if not text_content:
+            logger.warning(f"No content extracted from {filename_hint}")
+            return []
+        
+        documents = self._build_documents(text_content, {
+            "file_path": filename_hint,
+            "file_name": file_name,
+            "file_type": ext,
+            "file_size": size_mb
+        })
         
+        logger.info(f"Successfully processed {filename_hint} into {len(documents)} chunks")
+        return documents
+    
+    def _build_documents(self, text_content: str, base_metadata: Dict[str, Any]) -> List[Document]:
+        """Split text into chunks and wrap each in a Document"""
         # Split into chunks
-        nodes = self.node_parser.get_nodes_from_documents([document])
+        chunks = self.split_text(text_content)
+        total_chunks = len(chunks)
         
-        # Convert nodes back to documents for consistency
-        documents = []
-        for i, node in enumerate(nodes):
-            doc = Document(
-                text=node.text,
-                metadata={
-                    **document.metadata,
-                    "chunk_id": i,
-                    "total_chunks": len(nodes)
-                }
+        # Create one document per chunk
+        documents = [
+            Document(
+                text=chunk,
+                metadata=dict(base_metadata, chunk_id=i, total_chunks=total_chunks)
             )
-            documents.append(doc)
+            for i, chunk in enumerate(chunks)
+        ]
         
-        logger.info(f"Successfully processed {file_path} into {len(documents)} chunks")
         return documents
     
+    def find_supported_files(self, directory_path: str) -> List[Path]:
+        """Recursively find all supported files in a directory.
+
+        Walks the tree once with ``os.scandir`` and skips files over
+        ``MAX_FILE_SIZE_MB`` using the size from the directory entry.
+        """
+        supported_files = []
+        pending = [directory_path]
+        
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in _SUPPORTED_EXTENSIONS:
+                            try:
+                                file_size = entry.stat().st_size
+                            except OSError as e:
+                                # Broken symlink, permission error or file removed mid-scan
+                                logger.warning(f"Cannot stat file, skipping: {entry.path} ({str(e)})")
+                                continue
+                            if file_size > _MAX_FILE_SIZE_BYTES:
+                                logger.warning(f"Skipping file over {_MAX_FILE_SIZE_MB} MB: {entry.path}")
+                                continue
+                            supported_files.append(Path(entry.path))
+            except OSError as e:
+                logger.warning(f"Cannot scan directory: {str(e)}")
+        
+        return supported_files
+    
     def process_directory(self, directory_path: str) -> List[Document]:
         """Process all supported files in a directory"""
         documents = []
@@ -153,20 +407,31 @@ class DocumentProcessor:
             logger.error(f"Directory does not exist: {directory_path}")
             return documents
         
-        # Find all supported files
-        supported_files = []
-        for ext in config.SUPPORTED_EXTENSIONS:
-            supported_files.extend(directory.rglob(f"*{ext}"))
+        supported_files = self.find_supported_files(directory_path)
         
         logger.info(f"Found {len(supported_files)} supported files in {directory_path}")
         
-        for file_path in supported_files:
-            try:
-                file_documents = self.process_file(str(file_path))
-                documents.extend(file_documents)
-            except Exception as e:
-                logger.error(f"Error processing {file_path}: {str(e)}")
-                continue
+        if len(supported_files) <= 1:
+            for file_path in supported_files:
+                try:
+                    documents.extend(self.process_file(str(file_path)))
+                except Exception as e:
+                    logger.error(f"Error processing {file_path}: {str(e)}")
+            
+        else:
+            # OCR and layout analysis are CPU-bound, so spread files across processes
+            max_workers = min(config.MAX_PROCESS_WORKERS, len(supported_files))
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context()) as executor:
+                futures = {
+                    executor.submit(_process_one, str(file_path)): file_path
+                    for file_path in supported_files
+                }
+                
+                for future in as_completed(futures):
+                    try:
+                        documents.extend(future.result())
+                    except Exception as e:
+                        logger.error(f"Error processing {futures[future]}: {str(e)}")
         
         logger.info(f"Successfully processed {len(documents)} document chunks from {len(supported_files)} files")
         return documents
@@ -176,11 +441,13 @@ class DocumentProcessor:
         if uploaded_file is None:
             return []
         
-        # Create temporary file
+        # Gradio already stores uploads on disk, so process them in place
+        if os.path.isfile(uploaded_file.name):
+            return self.process_file(uploaded_file.name)
+        
+        # Otherwise stream the contents into a temporary file
         with tempfile.NamedTemporaryFile(delete=False, suffix=Path(uploaded_file.name).suffix) as tmp_file:
-            # Copy uploaded file content
-            with open(uploaded_file.name, 'rb') as src:
-                tmp_file.write(src.read())
+            shutil.copyfileobj(uploaded_file, tmp_file, length=1 << 20)
             tmp_file_path = tmp_file.name
         
         try:
@@ -191,5 +458,5 @@ class DocumentProcessor:
             # Clean up temporary file
             try:
                 os.unlink(tmp_file_path)
-            except:
-                pass
\ No newline at end of file
+            except OSError:
+                pass
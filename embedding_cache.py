@@ -0,0 +1,111 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List
+import numpy as np
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from loguru import logger
+import config
+
+# SQLite caps the number of bound parameters per statement
+_SQLITE_MAX_PARAMS = 900
+
+class EmbeddingCache(BaseEmbedding):
+    """
+    Persistent embedding cache wrapping another LlamaIndex embedding model.
+
+    Text embeddings are stored in SQLite keyed by a content hash of each chunk,
+    so re-uploading or re-processing identical content never re-runs the model.
+    Query embeddings are passed straight through to the wrapped model.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _db_path: str = PrivateAttr()
+    _conn: Any = PrivateAttr()
+    _lock: Any = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, db_path: str = config.EMBEDDING_CACHE_PATH, **kwargs: Any):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs
+        )
+        self._embed_model = embed_model
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        config.ensure_dir(os.path.dirname(db_path) or ".")
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        logger.info(f"Embedding cache opened at {db_path}")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "EmbeddingCache"
+
+    def _hash_text(self, text: str) -> bytes:
+        """Hash chunk text together with the model name"""
+        return hashlib.blake2b(
+            f"{self.model_name}\0{text}".encode("utf-8"),
+            digest_size=16
+        ).digest()
+
+    def _fetch(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """Batch-fetch cached vectors for the given hashes"""
+        found = {}
+        for start in range(0, len(keys), _SQLITE_MAX_PARAMS):
+            batch = keys[start:start + _SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE hash IN ({placeholders})",
+                batch
+            ).fetchall()
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return found
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, only running the wrapped model on cache misses"""
+        keys = [self._hash_text(text) for text in texts]
+
+        with self._lock:
+            cached = self._fetch(list(set(keys)))
+
+        # Embed each missing text once, even if it appears several times
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self._embed_model.get_text_embedding_batch(list(missing.values()))
+            rows = []
+            for key, vector in zip(missing.keys(), vectors):
+                cached[key] = vector
+                rows.append((key, np.asarray(vector, dtype=np.float32).tobytes()))
+
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (hash, vector) VALUES (?, ?)",
+                    rows
+                )
+                self._conn.commit()
+
+        logger.debug(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        return [cached[key] for key in keys]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._embed_model.aget_query_embedding(query)
@@ -1,11 +1,41 @@
 import os
+import re
+import json
+import time
 import subprocess
+import importlib.util
 from pathlib import Path
-from huggingface_hub import hf_hub_download, list_repo_files
-from llama_cpp import Llama
+from typing import Optional
+
+# Use the multi-connection Rust downloader when it is installed; must be set
+# before huggingface_hub is imported
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+
+from huggingface_hub import snapshot_download, list_repo_files
+from huggingface_hub.utils import HfHubHTTPError
+from llama_cpp import Llama, LlamaRAMCache
 from loguru import logger
 import config
 
+# Preferred quantizations, most preferred first
+_QUANT_PREFERENCE = {'q4_k_m': 0, 'q4_0': 1, 'q5_k_m': 2, 'q8_0': 3}
+_QUANT_RE = re.compile('|'.join(_QUANT_PREFERENCE), re.IGNORECASE)
+
+# Shard suffix of split GGUF files, e.g. "model-00001-of-00003.gguf"
+_SPLIT_RE = re.compile(r'-\d{5}-of-(\d{5})\.gguf$')
+
+def resolve_n_threads() -> int:
+    """Return the configured decode thread count, defaulting to physical cores.
+
+    Decode is memory-bandwidth bound, so SMT siblings add contention rather
+    than throughput; ``os.cpu_count() // 2`` approximates the physical cores.
+    """
+    n_threads = config.LLAMA_CPP_CONFIG["n_threads"]
+    if n_threads:
+        return n_threads
+    return max(1, (os.cpu_count() or 2) // 2)
+
 class ModelSetup:
     """
     Setup and manage the quantized LLM model with llama.cpp
@@ -13,67 +43,137 @@ class ModelSetup:
     
     def __init__(self):
         self.model_path = config.LLAMA_CPP_CONFIG["model_path"]
+        self.meta_path = f"{self.model_path}.meta.json"
         self.model = None
         
+        # A split model stays under its shard names and is loaded from shard 1
+        model_file = self._read_selection()
+        if model_file and _SPLIT_RE.search(model_file):
+            self.model_path = os.path.join(config.MODEL_PATH, model_file)
+        
+    def _read_selection(self) -> Optional[str]:
+        """Return the repo file chosen on a previous run, if recorded for this repo"""
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("repo_id") == config.MODEL_NAME and meta.get("requested_file") == config.MODEL_FILE:
+                return meta.get("model_file")
+        except (OSError, ValueError):
+            pass
+        return None
+    
+    def _write_selection(self, model_file: str):
+        """Record the chosen repo file next to the model"""
+        try:
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "repo_id": config.MODEL_NAME,
+                    "requested_file": config.MODEL_FILE,
+                    "model_file": model_file
+                }, f)
+        except OSError as e:
+            logger.warning(f"Could not record model selection: {str(e)}")
+    
+    def _select_model_file(self) -> Optional[str]:
+        """Pick the GGUF file to download from the repository listing"""
+        # List all files in the repository
+        repo_files = list_repo_files(
+            repo_id=config.MODEL_NAME,
+            token=config.HUGGINGFACE_TOKEN if config.HUGGINGFACE_TOKEN else None
+        )
+        
+        # Look for GGUF files (quantized models)
+        gguf_files = [f for f in repo_files if f.endswith('.gguf')]
+        
+        if not gguf_files:
+            logger.error(f"No GGUF files found in {config.MODEL_NAME}")
+            return None
+        
+        # Prefer the specified model file, or pick the first available
+        if config.MODEL_FILE in gguf_files:
+            return config.MODEL_FILE
+        
+        # Look for common quantization patterns, best-ranked first
+        ranked = []
+        for position, f in enumerate(gguf_files):
+            match = _QUANT_RE.search(f)
+            if match:
+                ranked.append((_QUANT_PREFERENCE[match.group(0).lower()], position, f))
+        
+        if ranked:
+            return min(ranked)[2]
+        
+        return gguf_files[0]  # Fallback to first GGUF file
+    
     def download_quantized_model(self) -> bool:
         """Download the quantized model from Hugging Face"""
         try:
-            logger.info(f"Checking for quantized model: {config.MODEL_NAME}")
-            
-            # List all files in the repository
-            repo_files = list_repo_files(
-                repo_id=config.MODEL_NAME,
-                token=config.HUGGINGFACE_TOKEN if config.HUGGINGFACE_TOKEN else None
-            )
-            
-            # Look for GGUF files (quantized models)
-            gguf_files = [f for f in repo_files if f.endswith('.gguf')]
+            # Nothing to fetch when the model is already on disk
+            if os.path.exists(self.model_path):
+                logger.info(f"Model already exists at: {self.model_path}")
+                return True
             
-            if not gguf_files:
-                logger.error(f"No GGUF files found in {config.MODEL_NAME}")
-                return False
+            logger.info(f"Checking for quantized model: {config.MODEL_NAME}")
             
-            # Prefer the specified model file, or pick the first available
-            model_file = None
-            if config.MODEL_FILE in gguf_files:
-                model_file = config.MODEL_FILE
-            else:
-                # Look for common quantization patterns
-                for pattern in ['q4_k_m', 'q4_0', 'q5_k_m', 'q8_0']:
-                    candidates = [f for f in gguf_files if pattern in f.lower()]
-                    if candidates:
-                        model_file = candidates[0]
-                        break
-                
+            # Reuse the file chosen last time instead of listing the repo again
+            model_file = self._read_selection()
+            if not model_file:
+                model_file = self._select_model_file()
                 if not model_file:
-                    model_file = gguf_files[0]  # Fallback to first GGUF file
+                    return False
+                self._write_selection(model_file)
             
             logger.info(f"Selected model file: {model_file}")
             
-            # Download the model if it doesn't exist
-            if not os.path.exists(self.model_path):
-                logger.info("Downloading quantized model...")
-                downloaded_path = hf_hub_download(
-                    repo_id=config.MODEL_NAME,
-                    filename=model_file,
-                    local_dir=config.MODEL_PATH,
-                    token=config.HUGGINGFACE_TOKEN if config.HUGGINGFACE_TOKEN else None
-                )
-                
-                # Move to expected path if different
-                if downloaded_path != self.model_path:
-                    os.rename(downloaded_path, self.model_path)
-                
+            split = _SPLIT_RE.search(model_file)
+            if split:
+                # Fetch every shard concurrently; llama.cpp opens the first and
+                # finds the others next to it by name, so they are not renamed
+                prefix, shard_count = model_file[:split.start()], split.group(1)
+                logger.info(f"Downloading {int(shard_count)} model shards...")
+                local_dir = self._snapshot_download([f"{prefix}-*-of-{shard_count}.gguf"])
+                self.model_path = os.path.join(local_dir, f"{prefix}-00001-of-{shard_count}.gguf")
+                self._write_selection(os.path.relpath(self.model_path, config.MODEL_PATH))
                 logger.info(f"Model downloaded to: {self.model_path}")
-            else:
-                logger.info(f"Model already exists at: {self.model_path}")
+                return True
+            
+            logger.info("Downloading quantized model...")
+            local_dir = self._snapshot_download([model_file])
+            downloaded_path = os.path.join(local_dir, model_file)
+            
+            # Move to expected path if different
+            if os.path.abspath(downloaded_path) != os.path.abspath(self.model_path):
+                try:
+                    os.replace(downloaded_path, self.model_path)
+                except OSError:
+                    # Different filesystem: link to the download rather than copy it
+                    os.symlink(os.path.abspath(downloaded_path), self.model_path)
             
+            logger.info(f"Model downloaded to: {self.model_path}")
             return True
             
         except Exception as e:
             logger.error(f"Error downloading model: {str(e)}")
             return False
     
+    def _snapshot_download(self, patterns: list) -> str:
+        """Download matching repo files concurrently, retrying transient Hub errors"""
+        for attempt in range(1, config.MODEL_DOWNLOAD_RETRIES + 1):
+            try:
+                return snapshot_download(
+                    repo_id=config.MODEL_NAME,
+                    allow_patterns=patterns,
+                    local_dir=config.ensure_dir(config.MODEL_PATH),
+                    max_workers=config.MODEL_DOWNLOAD_WORKERS,
+                    token=config.HUGGINGFACE_TOKEN if config.HUGGINGFACE_TOKEN else None
+                )
+            except HfHubHTTPError as e:
+                if attempt == config.MODEL_DOWNLOAD_RETRIES:
+                    raise
+                delay = 2 ** attempt
+                logger.warning(f"Download attempt {attempt} failed ({str(e)}), retrying in {delay}s")
+                time.sleep(delay)
+    
     def load_model(self) -> bool:
         """Load the model with llama.cpp"""
         try:
@@ -87,9 +187,14 @@ class ModelSetup:
                 model_path=self.model_path,
                 n_ctx=config.LLAMA_CPP_CONFIG["n_ctx"],
                 n_batch=config.LLAMA_CPP_CONFIG["n_batch"],
-                n_threads=config.LLAMA_CPP_CONFIG["n_threads"],
+                n_threads=resolve_n_threads(),
+                numa=config.LLAMA_CPP_CONFIG["numa"],
+                n_gpu_layers=config.LLAMA_CPP_CONFIG["n_gpu_layers"],
+                use_mmap=config.LLAMA_CPP_CONFIG["use_mmap"],
+                use_mlock=config.LLAMA_CPP_CONFIG["use_mlock"],
                 verbose=config.LLAMA_CPP_CONFIG["verbose"]
             )
+            self.enable_prompt_cache()
             
             logger.info("Model loaded successfully!")
             return True
@@ -98,6 +203,24 @@ class ModelSetup:
             logger.error(f"Error loading model: {str(e)}")
             return False
     
+    def enable_prompt_cache(self):
+        """Attach a RAM prompt cache so calls sharing a prefix skip its prefill"""
+        if self.model is not None and self.model.cache is None:
+            self.model.set_cache(LlamaRAMCache(capacity_bytes=config.LLAMA_CPP_CONFIG["prompt_cache_bytes"]))
+    
+    def prewarm_prompt_cache(self, prefix: str):
+        """Evaluate a shared prompt prefix once and store its state in the cache"""
+        try:
+            tokens = self.model.tokenize(prefix.encode("utf-8"))
+            self.model.reset()
+            self.model.eval(tokens)
+            self.model.cache[tokens] = self.model.save_state()
+            
+            logger.info(f"Prompt cache prewarmed with {len(tokens)} prefix tokens")
+            
+        except Exception as e:
+            logger.warning(f"Could not prewarm prompt cache: {str(e)}")
+    
     def generate_response(self, prompt: str, **kwargs) -> str:
         """Generate response using the loaded model"""
         if self.model is None:
@@ -126,8 +249,8 @@ class ModelSetup:
             logger.error(f"Error generating response: {str(e)}")
             return f"Error generating response: {str(e)}"
     
-    def generate_streaming_response(self, prompt: str, **kwargs):
-        """Generate streaming response using the loaded model"""
+    def generate_streaming_response(self, prompt: str, chunk_tokens: int = config.STREAM_CHUNK_TOKENS, **kwargs):
+        """Generate streaming response using the loaded model, yielding ``chunk_tokens`` tokens at a time"""
         if self.model is None:
             yield "Model not loaded. Please load the model first."
             return
@@ -145,27 +268,36 @@ class ModelSetup:
             }
             
             # Generate streaming response
+            buffer = []
             for chunk in self.model(prompt, **generation_config):
                 if 'choices' in chunk and chunk['choices']:
                     token = chunk['choices'][0].get('text', '')
                     if token:
-                        yield token
+                        buffer.append(token)
+                        if len(buffer) >= chunk_tokens:
+                            yield "".join(buffer)
+                            buffer.clear()
+            
+            if buffer:
+                yield "".join(buffer)
                         
         except Exception as e:
             logger.error(f"Error generating streaming response: {str(e)}")
             yield f"Error generating response: {str(e)}"
     
     def test_model(self) -> bool:
-        """Test the loaded model with a simple prompt"""
+        """Test the loaded model with a single-token generation"""
         try:
+            # One forward pass is enough to touch the weights and initialize kernels
             test_prompt = "Hello, how are you?"
-            response = self.generate_response(test_prompt, max_tokens=50)
+            response = self.generate_response(test_prompt, max_tokens=1)
             
-            if response and len(response) > 0:
+            # A single token may strip to nothing, so only generation errors fail the test
+            if self.model is not None and not response.startswith("Error generating response"):
                 logger.info(f"Model test successful. Response: {response[:100]}...")
                 return True
             else:
-                logger.error("Model test failed: empty response")
+                logger.error(f"Model test failed: {response}")
                 return False
                 
         except Exception as e:
@@ -177,12 +309,16 @@ class ModelSetup:
         info = {
             "model_path": self.model_path,
             "model_loaded": self.model is not None,
-            "file_exists": os.path.exists(self.model_path),
+            "file_exists": False,
             "file_size_mb": 0
         }
         
-        if os.path.exists(self.model_path):
-            info["file_size_mb"] = os.path.getsize(self.model_path) / (1024 * 1024)
+        # One stat call covers both existence and size
+        try:
+            info["file_size_mb"] = os.stat(self.model_path).st_size / (1024 * 1024)
+            info["file_exists"] = True
+        except OSError:
+            pass
         
         if self.model:
             try:
@@ -212,7 +348,7 @@ def setup_model() -> ModelSetup:
         return None
     
     # Test model
-    if not model_setup.test_model():
+    if config.LLAMA_CPP_CONFIG.get("run_warmup_test", False) and not model_setup.test_model():
         logger.warning("Model test failed, but continuing...")
     
     return model_setup
\ No newline at end of file
@@ -1,24 +1,92 @@
-from typing import List, Optional, Generator
+import os
+import math
+import asyncio
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import List, Optional, AsyncGenerator, Generator, Iterator, Tuple
+import numpy as np
 import chromadb
 from llama_index.core import (
     VectorStoreIndex,
     ServiceContext,
     StorageContext,
     Settings,
+    load_index_from_storage,
+    PromptTemplate,
     get_response_synthesizer
 )
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.core.retrievers import VectorIndexRetriever
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.postprocessor import SimilarityPostprocessor
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.bridge.pydantic import Field
 from llama_index.llms.llama_cpp import LlamaCPP
 from llama_index.core.callbacks import CallbackManager, LlamaDebugHandler
+from llama_index.core.schema import MetadataMode, TextNode, QueryBundle
 from document_processor import DocumentProcessor
-from model_setup import ModelSetup
+from embedding_cache import EmbeddingCache
+from model_setup import ModelSetup, resolve_n_threads
 from loguru import logger
 import config
 
+# Characters of each source shown in previews
+_PREVIEW_CHARS = 500
+
+def _preview(text: str) -> str:
+    """Truncate source text for display"""
+    if len(text) > _PREVIEW_CHARS:
+        return text[:_PREVIEW_CHARS] + "..."
+    return text
+
+class RelativeScorePostprocessor(BaseNodePostprocessor):
+    """
+    Keep only nodes scoring within ``ratio`` of the best match, at most ``max_nodes``.
+
+    Usually only the top few chunks are relevant; pruning the rest keeps them
+    out of the synthesizer prompt and shortens prefill.
+    """
+    
+    ratio: float = Field(default=0.85)
+    max_nodes: int = Field(default=5)
+    
+    @classmethod
+    def class_name(cls) -> str:
+        return "RelativeScorePostprocessor"
+    
+    def _postprocess_nodes(self, nodes: List, query_bundle: Optional[QueryBundle] = None) -> List:
+        ranked = sorted(nodes, key=lambda node: node.score or 0.0, reverse=True)
+        if not ranked:
+            return ranked
+        
+        floor = (ranked[0].score or 0.0) * self.ratio
+        return [node for node in ranked[:self.max_nodes] if (node.score or 0.0) >= floor]
+
+class CosineScorePostprocessor(BaseNodePostprocessor):
+    """
+    Convert Chroma similarity scores back to cosine similarity.
+
+    ChromaVectorStore scores nodes as ``exp(-distance)``, so the same cutoff
+    means different things for collections built with different distance
+    spaces. For normalized embeddings the cosine and ip distances are
+    ``1 - cos`` and the squared L2 distance is ``2 - 2 cos``.
+    """
+    
+    space: str = Field(default="l2")
+    
+    @classmethod
+    def class_name(cls) -> str:
+        return "CosineScorePostprocessor"
+    
+    def _postprocess_nodes(self, nodes: List, query_bundle: Optional[QueryBundle] = None) -> List:
+        scale = 0.5 if self.space == "l2" else 1.0
+        for node in nodes:
+            if node.score:
+                node.score = 1.0 - scale * -math.log(node.score)
+        return nodes
+
 class RAGEngine:
     """
     RAG Engine using LlamaIndex for orchestration
@@ -28,9 +96,28 @@ class RAGEngine:
         self.document_processor = DocumentProcessor()
         self.model_setup = None
         self.vector_store = None
+        self.storage_context = None
         self.index = None
         self.query_engine = None
-        self.embedding_model = None
+        self._embedding_model = None
+        self._embedding_lock = threading.Lock()
+        
+        # Retrievers read the index live, so they stay valid across inserts and
+        # only need rebuilding when the index object itself is replaced
+        self._retriever_cache = {}
+        self._retriever_index = None
+        self._query_engine_index = None
+        
+        # Converts vector store scores to cosine similarity; None when the
+        # store already reports cosine (FAISS inner product)
+        self._score_postprocessor = None
+        
+        # Vector count for get_index_stats; reset whenever nodes are inserted
+        self._doc_count_cache = None
+        
+        # llama.cpp decodes one sequence at a time; retrieval may run concurrently
+        # but generation is serialized through this lock
+        self._llm_lock = threading.Lock()
         
         # Setup LlamaIndex settings
         self.setup_llamaindex()
@@ -38,14 +125,7 @@ class RAGEngine:
     def setup_llamaindex(self):
         """Setup LlamaIndex configuration"""
         try:
-            # Setup embedding model
-            logger.info(f"Loading embedding model: {config.EMBEDDING_MODEL}")
-            self.embedding_model = HuggingFaceEmbedding(
-                model_name=config.EMBEDDING_MODEL
-            )
-            
-            # Set global settings
-            Settings.embed_model = self.embedding_model
+            # Set global settings; the embedding model loads on first use
             Settings.chunk_size = config.CHUNK_SIZE
             Settings.chunk_overlap = config.CHUNK_OVERLAP
             
@@ -55,22 +135,57 @@ class RAGEngine:
             logger.error(f"Error setting up LlamaIndex: {str(e)}")
             raise
     
+    @property
+    def embedding_model(self) -> EmbeddingCache:
+        """Embedding model, loaded and registered with LlamaIndex on first access"""
+        if self._embedding_model is None:
+            with self._embedding_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = self._load_embedding_model()
+                    Settings.embed_model = self._embedding_model
+        return self._embedding_model
+    
+    def _load_embedding_model(self) -> EmbeddingCache:
+        """Load the HuggingFace embedding model"""
+        # torch and sentence-transformers take seconds to import and initialize
+        import torch
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        
+        device = config.EMBEDDING_DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")
+        model_kwargs = {}
+        if device.startswith("cuda") and config.EMBEDDING_FP16:
+            model_kwargs["torch_dtype"] = torch.float16
+        
+        # Wrapped in a persistent cache so that identical chunks are never embedded twice
+        logger.info(f"Loading embedding model: {config.EMBEDDING_MODEL} on {device}")
+        return EmbeddingCache(
+            HuggingFaceEmbedding(
+                model_name=config.EMBEDDING_MODEL,
+                embed_batch_size=config.EMBED_BATCH_SIZE,
+                device=device,
+                model_kwargs=model_kwargs
+            )
+        )
+    
     def setup_model(self) -> bool:
         """Setup the LLM model"""
+        if config.LLM_SERVER_URL:
+            return self.setup_server_llm()
+        
         try:
             # Initialize model setup
             self.model_setup = ModelSetup()
             
-            # Download and load model
+            # Download model
             if not self.model_setup.download_quantized_model():
                 logger.error("Failed to download model")
                 return False
             
-            if not self.model_setup.load_model():
-                logger.error("Failed to load model")
+            if not os.path.exists(self.model_setup.model_path):
+                logger.error(f"Model file not found: {self.model_setup.model_path}")
                 return False
             
-            # Create LlamaIndex LLM wrapper
+            # Create LlamaIndex LLM wrapper; it loads the only Llama instance
             Settings.llm = LlamaCPP(
                 model_path=config.LLAMA_CPP_CONFIG["model_path"],
                 temperature=config.LLAMA_CPP_CONFIG["temperature"],
@@ -81,9 +196,23 @@ class RAGEngine:
                     "top_k": config.LLAMA_CPP_CONFIG["top_k"],
                     "repeat_penalty": config.LLAMA_CPP_CONFIG["repeat_penalty"]
                 },
+                model_kwargs={
+                    "n_batch": config.LLAMA_CPP_CONFIG["n_batch"],
+                    "n_threads": resolve_n_threads(),
+                    "numa": config.LLAMA_CPP_CONFIG["numa"],
+                    "n_gpu_layers": config.LLAMA_CPP_CONFIG["n_gpu_layers"],
+                    "use_mmap": config.LLAMA_CPP_CONFIG["use_mmap"],
+                    "use_mlock": config.LLAMA_CPP_CONFIG["use_mlock"]
+                },
                 verbose=config.LLAMA_CPP_CONFIG["verbose"]
             )
             
+            # Share the wrapper's model instead of loading the GGUF a second time
+            self.model_setup.model = Settings.llm._model
+            
+            # Evaluate the static system prompt once so queries start from its KV state
+            self.prewarm_prompt_cache()
+            
             logger.info("Model setup completed successfully")
             return True
             
@@ -91,21 +220,142 @@ class RAGEngine:
             logger.error(f"Error setting up model: {str(e)}")
             return False
     
+    def setup_server_llm(self) -> bool:
+        """Use an OpenAI-compatible completion server as the LLM.
+
+        The server batches concurrent sequences into shared decode steps, so
+        queries are no longer serialized through the in-process model lock.
+        """
+        try:
+            from llama_index.llms.openai_like import OpenAILike
+            
+            logger.info(f"Using LLM server at {config.LLM_SERVER_URL}")
+            Settings.llm = OpenAILike(
+                api_base=config.LLM_SERVER_URL,
+                api_key=os.getenv("LLM_SERVER_API_KEY", "none"),
+                model=config.MODEL_FILE,
+                is_chat_model=False,
+                context_window=config.LLAMA_CPP_CONFIG["n_ctx"],
+                max_tokens=config.LLAMA_CPP_CONFIG["max_tokens"],
+                temperature=config.LLAMA_CPP_CONFIG["temperature"],
+                additional_kwargs={"top_p": config.LLAMA_CPP_CONFIG["top_p"]}
+            )
+            
+            # Let concurrent queries reach the server together
+            self._llm_lock = contextlib.nullcontext()
+            
+            logger.info("Model setup completed successfully")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error setting up LLM server client: {str(e)}")
+            return False
+    
+    def prewarm_prompt_cache(self):
+        """Precompute the KV cache for the system prompt shared by every query"""
+        self.model_setup.enable_prompt_cache()
+        self.model_setup.prewarm_prompt_cache(config.SYSTEM_PROMPT)
+    
     def setup_vector_store(self):
-        """Setup vector store (ChromaDB)"""
+        """Setup vector store (ChromaDB, or FAISS HNSW when configured)"""
+        if config.VECTOR_STORE_TYPE == "faiss":
+            self.setup_faiss_vector_store()
+            return
+        
         try:
             logger.info("Setting up ChromaDB vector store")
             
             # Initialize ChromaDB client
-            chroma_client = chromadb.PersistentClient(path=config.PERSIST_DIR)
+            chroma_client = chromadb.PersistentClient(path=config.ensure_dir(config.PERSIST_DIR))
+            
+            chroma_collection = self._get_chroma_collection(chroma_client)
             
-            # Get or create collection
-            chroma_collection = chroma_client.get_or_create_collection(
-                name=config.COLLECTION_NAME
+            # Scores depend on the distance space the collection was created with
+            self._score_postprocessor = CosineScorePostprocessor(
+                space=(chroma_collection.metadata or {}).get("hnsw:space", "l2")
             )
             
             # Create ChromaDB vector store
             self.vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
+            self.storage_context = StorageContext.from_defaults(vector_store=self.vector_store)
+            
+            logger.info("Vector store setup completed")
+            
+        except Exception as e:
+            logger.error(f"Error setting up vector store: {str(e)}")
+            raise
+    
+    def _get_chroma_collection(self, chroma_client):
+        """Open the existing collection, creating it with the HNSW config if missing.
+
+        HNSW parameters are fixed when a collection is created, so they are only
+        passed on creation; an existing collection keeps the ones it was built with.
+        """
+        try:
+            chroma_collection = chroma_client.get_collection(name=config.COLLECTION_NAME)
+        except Exception:
+            logger.info(f"Creating ChromaDB collection: {config.COLLECTION_NAME}")
+            return chroma_client.create_collection(
+                name=config.COLLECTION_NAME,
+                metadata=config.CHROMA_HNSW_CONFIG
+            )
+        
+        existing = chroma_collection.metadata or {}
+        differing = {
+            key: (existing.get(key), value)
+            for key, value in config.CHROMA_HNSW_CONFIG.items()
+            if existing.get(key) != value
+        }
+        if differing:
+            logger.warning(
+                f"Collection {config.COLLECTION_NAME} keeps its original HNSW settings "
+                f"(existing, configured): {differing}; rebuild it to apply the new ones"
+            )
+        return chroma_collection
+    
+    def setup_faiss_vector_store(self):
+        """Setup an in-memory FAISS HNSW vector store persisted under FAISS_PERSIST_DIR"""
+        try:
+            import faiss
+            from llama_index.vector_stores.faiss import FaissVectorStore
+            
+            persist_dir = config.ensure_dir(config.FAISS_PERSIST_DIR)
+            
+            if os.path.exists(os.path.join(persist_dir, "docstore.json")):
+                logger.info(f"Loading FAISS vector store from {persist_dir}")
+                self.vector_store = FaissVectorStore.from_persist_dir(persist_dir)
+                self.storage_context = StorageContext.from_defaults(
+                    vector_store=self.vector_store,
+                    persist_dir=persist_dir
+                )
+                faiss_index = self.vector_store.client
+            else:
+                logger.info("Creating FAISS HNSW vector store")
+                # Embeddings are normalized, so inner product is cosine similarity
+                if config.EMBEDDING_QUANTIZATION == "int8":
+                    # One byte per dimension over a fixed [-1, 1] range. Normalized
+                    # embeddings never leave it, so later inserts are not clipped to
+                    # ranges learned from whichever batch happened to come first
+                    faiss_index = faiss.IndexHNSWSQ(
+                        config.EMBEDDING_DIMENSION,
+                        faiss.ScalarQuantizer.QT_8bit_uniform,
+                        config.FAISS_CONFIG["M"],
+                        faiss.METRIC_INNER_PRODUCT
+                    )
+                    bounds = np.array([[-1.0], [1.0]], dtype=np.float32)
+                    faiss_index.train(np.repeat(bounds, config.EMBEDDING_DIMENSION, axis=1))
+                else:
+                    faiss_index = faiss.IndexHNSWFlat(
+                        config.EMBEDDING_DIMENSION,
+                        config.FAISS_CONFIG["M"],
+                        faiss.METRIC_INNER_PRODUCT
+                    )
+                faiss_index.hnsw.efConstruction = config.FAISS_CONFIG["ef_construction"]
+                self.vector_store = FaissVectorStore(faiss_index=faiss_index)
+                self.storage_context = StorageContext.from_defaults(vector_store=self.vector_store)
+            
+            if hasattr(faiss_index, "hnsw"):
+                faiss_index.hnsw.efSearch = config.FAISS_CONFIG["ef_search"]
             
             logger.info("Vector store setup completed")
             
@@ -113,16 +363,21 @@ class RAGEngine:
             logger.error(f"Error setting up vector store: {str(e)}")
             raise
     
+    def persist_index(self):
+        """Write the FAISS index and docstore to disk (Chroma persists on its own)"""
+        if config.VECTOR_STORE_TYPE == "faiss" and self.index is not None:
+            self.index.storage_context.persist(persist_dir=config.ensure_dir(config.FAISS_PERSIST_DIR))
+    
     def create_index(self, documents: List = None):
         """Create or load vector index"""
         try:
             if self.vector_store is None:
                 self.setup_vector_store()
             
-            # Create storage context
-            storage_context = StorageContext.from_defaults(
-                vector_store=self.vector_store
-            )
+            # The index captures Settings.embed_model, so make sure it is loaded
+            self.embedding_model
+            
+            storage_context = self.storage_context
             
             if documents:
                 logger.info(f"Creating new index with {len(documents)} documents")
@@ -131,6 +386,15 @@ class RAGEngine:
                     storage_context=storage_context,
                     show_progress=True
                 )
+                self.persist_index()
+            elif config.VECTOR_STORE_TYPE == "faiss":
+                # FAISS only holds vectors; node text lives in the persisted docstore
+                if storage_context.index_store.index_structs():
+                    logger.info("Loading existing index")
+                    self.index = load_index_from_storage(storage_context)
+                else:
+                    logger.info("Creating empty index")
+                    self.index = VectorStoreIndex(nodes=[], storage_context=storage_context)
             else:
                 logger.info("Loading existing index")
                 self.index = VectorStoreIndex.from_vector_store(
@@ -149,27 +413,41 @@ class RAGEngine:
             if self.index is None:
                 raise ValueError("Index not created. Please create index first.")
             
+            # Inserts are visible through the existing engine's retriever
+            if self.query_engine is not None and self._query_engine_index is self.index:
+                return
+            
             # Configure retriever
-            retriever = VectorIndexRetriever(
-                index=self.index,
-                similarity_top_k=config.RAG_CONFIG["similarity_top_k"]
-            )
+            retriever = self._get_retriever(config.RAG_CONFIG["similarity_top_k"])
             
             # Configure response synthesizer
+            # The QA template starts with the system prompt so the prefilled
+            # KV state from prewarm_prompt_cache is reused for every query
             response_synthesizer = get_response_synthesizer(
                 response_mode=config.RAG_CONFIG["response_mode"],
-                streaming=config.RAG_CONFIG["streaming"]
+                streaming=config.RAG_CONFIG["streaming"],
+                text_qa_template=PromptTemplate(config.SYSTEM_PROMPT + config.QA_PROMPT_TEMPLATE)
             )
             
-            # Configure post-processor for similarity filtering
-            postprocessor = SimilarityPostprocessor(similarity_cutoff=0.7)
+            # Configure post-processors: scores as cosine similarity, absolute
+            # similarity filter, then prune chunks that score well below the best match
+            postprocessors = [
+                SimilarityPostprocessor(similarity_cutoff=config.RAG_CONFIG["similarity_cutoff"]),
+                RelativeScorePostprocessor(
+                    ratio=config.RAG_CONFIG["relative_score_cutoff"],
+                    max_nodes=config.RAG_CONFIG["similarity_top_k"]
+                )
+            ]
+            if self._score_postprocessor is not None:
+                postprocessors.insert(0, self._score_postprocessor)
             
             # Create query engine
             self.query_engine = RetrieverQueryEngine(
                 retriever=retriever,
                 response_synthesizer=response_synthesizer,
-                node_postprocessors=[postprocessor]
+                node_postprocessors=postprocessors
             )
+            self._query_engine_index = self.index
             
             logger.info("Query engine setup completed")
             
@@ -177,8 +455,25 @@ class RAGEngine:
             logger.error(f"Error setting up query engine: {str(e)}")
             raise
     
+    def _get_retriever(self, top_k: int) -> VectorIndexRetriever:
+        """Return a cached retriever for ``top_k`` over the current index"""
+        if self._retriever_index is not self.index:
+            self._retriever_cache = {}
+            self._retriever_index = self.index
+        
+        retriever = self._retriever_cache.get(top_k)
+        if retriever is None:
+            retriever = VectorIndexRetriever(index=self.index, similarity_top_k=top_k)
+            self._retriever_cache[top_k] = retriever
+        return retriever
+    
     def add_documents(self, documents: List):
-        """Add new documents to the index"""
+        """Add new documents to the index, embedding them in fixed-size batches.
+
+        Documents are already final chunks, so they are embedded directly and
+        inserted with one ``insert_nodes`` call instead of being re-parsed and
+        inserted one at a time.
+        """
         try:
             if not documents:
                 logger.warning("No documents provided to add")
@@ -186,16 +481,68 @@ class RAGEngine:
             
             logger.info(f"Adding {len(documents)} documents to index")
             
-            if self.index is None:
-                # Create new index
-                self.create_index(documents)
-            else:
-                # Add to existing index
-                for doc in documents:
-                    self.index.insert(doc)
+            nodes = []
+            for batch in self._split_batches(documents):
+                nodes.extend(self._embed_batch(batch))
+            
+            self._insert_nodes(nodes)
+            
+            logger.info("Documents added successfully")
+            
+        except Exception as e:
+            logger.error(f"Error adding documents: {str(e)}")
+            raise
+    
+    def _embed_batch(self, batch: List) -> List[TextNode]:
+        """Embed one batch of documents and return nodes carrying their vectors"""
+        texts = [doc.get_content(metadata_mode=MetadataMode.EMBED) for doc in batch]
+        embeddings = self.embedding_model.get_text_embedding_batch(texts)
+        
+        return [
+            TextNode(text=doc.text, metadata=doc.metadata, embedding=embedding)
+            for doc, embedding in zip(batch, embeddings)
+        ]
+    
+    async def _aembed_batch(self, batch: List, semaphore: asyncio.Semaphore) -> List[TextNode]:
+        """Embed one batch of documents off the event loop"""
+        async with semaphore:
+            return await asyncio.to_thread(self._embed_batch, batch)
+    
+    def _split_batches(self, documents: List) -> List[List]:
+        """Sort documents longest first and split them into embedding batches"""
+        documents = sorted(documents, key=lambda doc: len(doc.text), reverse=True)
+        batch_size = config.EMBED_BATCH_SIZE
+        return [documents[i:i + batch_size] for i in range(0, len(documents), batch_size)]
+    
+    def _insert_nodes(self, nodes: List[TextNode]):
+        """Insert pre-embedded nodes into the index and refresh the query engine"""
+        if self.index is None:
+            self.create_index()
+        
+        self.index.insert_nodes(nodes)
+        self._doc_count_cache = None
+        self.persist_index()
+        self.setup_query_engine()
+    
+    async def aadd_documents(self, documents: List):
+        """Add new documents to the index, embedding batches concurrently"""
+        try:
+            if not documents:
+                logger.warning("No documents provided to add")
+                return
+            
+            logger.info(f"Adding {len(documents)} documents to index asynchronously")
+            
+            batches = self._split_batches(documents)
+            
+            # Bound the number of batches embedding at the same time
+            semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_BATCHES)
+            embedded_batches = await asyncio.gather(
+                *[self._aembed_batch(batch, semaphore) for batch in batches]
+            )
             
-            # Refresh query engine
-            self.setup_query_engine()
+            nodes = [node for batch in embedded_batches for node in batch]
+            await asyncio.to_thread(self._insert_nodes, nodes)
             
             logger.info("Documents added successfully")
             
@@ -219,6 +566,36 @@ class RAGEngine:
             logger.error(f"Error processing directory: {str(e)}")
             raise
     
+    def process_and_add_directory_parallel(self, directory_path: str, workers: Optional[int] = None):
+        """Process files in a directory concurrently and add them to the index in one batch"""
+        try:
+            workers = workers or min(config.MAX_INGEST_WORKERS, os.cpu_count() or 1)
+            supported_files = self.document_processor.find_supported_files(directory_path)
+            logger.info(f"Processing {len(supported_files)} files from {directory_path} with {workers} workers")
+            
+            documents = []
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(self.document_processor.process_file, str(file_path)): file_path
+                    for file_path in supported_files
+                }
+                
+                for future in as_completed(futures):
+                    try:
+                        documents.extend(future.result())
+                    except Exception as e:
+                        logger.error(f"Error processing {futures[future]}: {str(e)}")
+            
+            if documents:
+                self.add_documents(documents)
+                logger.info(f"Successfully processed and added {len(documents)} documents")
+            else:
+                logger.warning("No documents were processed from the directory")
+                
+        except Exception as e:
+            logger.error(f"Error processing directory: {str(e)}")
+            raise
+    
     def process_and_add_file(self, file_path: str):
         """Process single file and add to index"""
         try:
@@ -235,41 +612,127 @@ class RAGEngine:
             logger.error(f"Error processing file: {str(e)}")
             raise
     
-    def query(self, question: str) -> str:
-        """Query the RAG system"""
+    def query(self, question: str, top_k: int = 3,
+              query_embedding: Optional[List[float]] = None) -> Tuple[str, List[dict]]:
+        """Query the RAG system, returning the answer and the source documents it used.
+
+        Shares the streaming path with ``stream_query`` and joins the chunks, so
+        failures raise instead of being returned as answer text.
+        """
+        token_stream, sources = self.stream_query(question, top_k=top_k, query_embedding=query_embedding)
+        return "".join(token_stream), sources
+    
+    def stream_query(self, question: str, top_k: int = 3,
+                     query_embedding: Optional[List[float]] = None) -> Tuple[Iterator[str], List[dict]]:
+        """Query the RAG system, returning a token stream and the source documents it used.
+
+        Retrieval runs before this returns, so the sources are available while the
+        answer is still being generated. A ``query_embedding`` already computed by
+        the caller is reused for retrieval instead of embedding the question again.
+
+        Retrieval errors raise here and generation errors raise from the stream,
+        so callers never mistake an error message for an answer (and cache it).
+        """
+        if self.query_engine is None:
+            raise RuntimeError("RAG system not initialized. Please add documents first.")
+        
         try:
-            if self.query_engine is None:
-                return "RAG system not initialized. Please add documents first."
-            
-            logger.info(f"Processing query: {question}")
-            response = self.query_engine.query(question)
+            logger.info(f"Processing streaming query: {question}")
+            query_bundle = QueryBundle(question, embedding=query_embedding)
+            nodes = self.query_engine.retrieve(query_bundle)
             
-            return str(response)
+            return self._stream_response(query_bundle, nodes), self._format_nodes(nodes[:top_k])
             
         except Exception as e:
-            logger.error(f"Error processing query: {str(e)}")
-            return f"Error processing query: {str(e)}"
+            logger.error(f"Error processing streaming query: {str(e)}")
+            raise
     
-    def query_streaming(self, question: str) -> Generator[str, None, None]:
-        """Query the RAG system with streaming response"""
+    def _stream_response(self, query_bundle: QueryBundle, nodes: List) -> Generator[str, None, None]:
+        """Generate the answer for retrieved nodes, yielding chunks as they are decoded"""
         try:
-            if self.query_engine is None:
-                yield "RAG system not initialized. Please add documents first."
-                return
-            
-            logger.info(f"Processing streaming query: {question}")
-            response = self.query_engine.query(question)
-            
-            # If streaming is enabled in the response synthesizer
-            if hasattr(response, 'response_gen'):
-                for chunk in response.response_gen:
-                    yield chunk
-            else:
-                yield str(response)
+            with self._llm_lock:
+                response = self.query_engine.synthesize(query_bundle, nodes)
                 
+                if hasattr(response, 'response_gen'):
+                    for chunk in response.response_gen:
+                        yield chunk
+                else:
+                    yield str(response)
+                
+        except Exception as e:
+            logger.error(f"Error processing streaming query: {str(e)}")
+            raise
+    
+    async def query_streaming(self, question: str,
+                              chunk_tokens: int = config.STREAM_CHUNK_TOKENS) -> AsyncGenerator[str, None]:
+        """Query the RAG system asynchronously, yielding the answer in small token chunks.
+
+        Retrieval and decoding run in worker threads so the event loop stays
+        free; generation starts as soon as the retrieved nodes are ready. One
+        thread both drives and closes the token generator, so a cancelled
+        caller stops generation after the chunk in progress and the model lock
+        is released without racing the decoding thread.
+        """
+        if self.query_engine is None:
+            yield "RAG system not initialized. Please add documents first."
+            return
+        
+        try:
+            logger.info(f"Processing streaming query: {question}")
+            query_bundle = QueryBundle(question)
+            nodes = await asyncio.to_thread(self.query_engine.retrieve, query_bundle)
         except Exception as e:
             logger.error(f"Error processing streaming query: {str(e)}")
             yield f"Error processing query: {str(e)}"
+            return
+        
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+        
+        def publish(item):
+            # The loop may already be closed if the caller went away
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(chunks.put_nowait, item)
+        
+        def produce():
+            tokens = self._stream_response(query_bundle, nodes)
+            try:
+                while not stop.is_set():
+                    # One queue hop per chunk rather than per token
+                    chunk = list(islice(tokens, chunk_tokens))
+                    if not chunk:
+                        break
+                    publish("".join(chunk))
+            except Exception as e:
+                publish(f"Error processing query: {str(e)}")
+            finally:
+                tokens.close()
+                publish(done)
+        
+        threading.Thread(target=produce, name="query-streaming", daemon=True).start()
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            # Cancellation and early exit propagate; the producer closes the
+            # generator (releasing the model lock) after its current chunk
+            stop.set()
+    
+    def _format_nodes(self, nodes: List) -> List[dict]:
+        """Convert retrieved nodes to source document dicts"""
+        return [
+            {
+                "content": _preview(node.text),
+                "score": getattr(node, 'score', 0.0),
+                "metadata": node.metadata
+            }
+            for node in nodes
+        ]
     
     def get_relevant_documents(self, question: str, top_k: int = 5) -> List[dict]:
         """Get relevant documents for a query without generating response"""
@@ -277,27 +740,26 @@ class RAGEngine:
             if self.index is None:
                 return []
             
-            retriever = VectorIndexRetriever(
-                index=self.index,
-                similarity_top_k=top_k
-            )
-            
-            nodes = retriever.retrieve(question)
+            nodes = self._get_retriever(top_k).retrieve(question)
+            if self._score_postprocessor is not None:
+                nodes = self._score_postprocessor.postprocess_nodes(nodes)
             
-            relevant_docs = []
-            for node in nodes:
-                relevant_docs.append({
-                    "content": node.text[:500] + "..." if len(node.text) > 500 else node.text,
-                    "score": node.score if hasattr(node, 'score') else 0.0,
-                    "metadata": node.metadata
-                })
-            
-            return relevant_docs
+            return self._format_nodes(nodes)
             
         except Exception as e:
             logger.error(f"Error retrieving relevant documents: {str(e)}")
             return []
     
+    def get_document_count(self) -> Optional[int]:
+        """Number of chunks in the vector store, or None if it cannot report one"""
+        if self._doc_count_cache is None:
+            collection = getattr(self.vector_store, '_collection', None)
+            if collection is not None:
+                self._doc_count_cache = collection.count()
+            elif config.VECTOR_STORE_TYPE == "faiss" and self.vector_store is not None:
+                self._doc_count_cache = self.vector_store.client.ntotal
+        return self._doc_count_cache
+    
     def get_index_stats(self) -> dict:
         """Get statistics about the index"""
         try:
@@ -315,8 +777,9 @@ class RAGEngine:
             
             # Try to get document count from vector store
             try:
-                if hasattr(self.vector_store, '_collection'):
-                    stats["document_count"] = self.vector_store._collection.count()
+                document_count = self.get_document_count()
+                if document_count is not None:
+                    stats["document_count"] = document_count
             except:
                 stats["document_count"] = "Unknown"
             
@@ -331,12 +794,20 @@ class RAGEngine:
         try:
             logger.info("Initializing RAG system...")
             
-            # Setup model
-            if not self.setup_model():
-                return False
-            
-            # Setup vector store
-            self.setup_vector_store()
+            # Model download/load, vector store and embedding model are
+            # independent, so start them together
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                model_future = executor.submit(self.setup_model)
+                vector_store_future = executor.submit(self.setup_vector_store)
+                embedding_future = executor.submit(lambda: self.embedding_model)
+                
+                # Setup model
+                if not model_future.result():
+                    return False
+                
+                # Setup vector store
+                vector_store_future.result()
+                embedding_future.result()
             
             # Try to load existing index
             try:
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import threading
+from typing import List, Optional, Tuple
+import faiss
+import numpy as np
+from loguru import logger
+import config
+
+class SemanticCache:
+    """
+    Semantic response cache backed by an in-memory FAISS inner-product index.
+
+    Questions are stored as L2-normalized embeddings so the inner product is the
+    cosine similarity. A lookup whose best match scores above the threshold
+    returns the stored answer without invoking the LLM.
+    """
+
+    def __init__(self, dimension: int = config.EMBEDDING_DIMENSION,
+                 threshold: float = config.SEMCACHE_TAU,
+                 ttl_seconds: float = config.SEMCACHE_TTL_SECONDS,
+                 max_entries: int = config.SEMCACHE_MAX_ENTRIES,
+                 dedup_threshold: float = config.SEMCACHE_DEDUP_TAU):
+        self.dimension = dimension
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.dedup_threshold = dedup_threshold
+        self.index = faiss.IndexFlatIP(dimension)
+        self.entries = []
+        # True when entries changed since the last save/load
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def _normalize(self, embedding) -> np.ndarray:
+        """Convert an embedding to a normalized float32 row vector"""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _rebuild_index(self):
+        """Rebuild the FAISS index from the remaining entries"""
+        self.index = faiss.IndexFlatIP(self.dimension)
+        if self.entries:
+            self.index.add(np.vstack([entry["vector"] for entry in self.entries]))
+
+    def _expire(self):
+        """Drop entries older than the configured TTL"""
+        cutoff = time.time() - self.ttl_seconds
+        alive = [entry for entry in self.entries if entry["timestamp"] >= cutoff]
+        if len(alive) != len(self.entries):
+            self.entries = alive
+            self._rebuild_index()
+
+    def _best_match(self, vector: np.ndarray) -> Tuple[float, int]:
+        """Return the (score, position) of the closest cached question"""
+        if self.index.ntotal == 0:
+            return -1.0, -1
+        scores, ids = self.index.search(vector, 1)
+        return float(scores[0][0]), int(ids[0][0])
+
+    def get(self, embedding) -> Optional[Tuple[str, List[dict]]]:
+        """Return the cached (response, relevant_docs) for a similar question"""
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            self._expire()
+            score, position = self._best_match(vector)
+
+            if position < 0 or score < self.threshold:
+                return None
+
+            entry = self.entries[position]
+            entry["last_access"] = time.time()
+            logger.info(f"Semantic cache hit (similarity: {score:.3f}) for: {entry['question']}")
+            return entry["response"], entry["relevant_docs"]
+
+    def put(self, embedding, question: str, response: str, relevant_docs: List[dict]):
+        """Store an answer, updating near-identical questions in place"""
+        vector = self._normalize(embedding)
+        now = time.time()
+
+        with self._lock:
+            self._expire()
+            score, position = self._best_match(vector)
+
+            if position >= 0 and score > self.dedup_threshold:
+                # Re-key the entry to the new question's embedding as well
+                self.entries[position].update({
+                    "vector": vector,
+                    "question": question,
+                    "response": response,
+                    "relevant_docs": relevant_docs,
+                    "timestamp": now,
+                    "last_access": now
+                })
+                self._rebuild_index()
+                self.dirty = True
+                return
+
+            if len(self.entries) >= self.max_entries:
+                # Evict the least recently used entry
+                lru_position = min(range(len(self.entries)), key=lambda i: self.entries[i]["last_access"])
+                del self.entries[lru_position]
+                self._rebuild_index()
+
+            self.entries.append({
+                "vector": vector,
+                "question": question,
+                "response": response,
+                "relevant_docs": relevant_docs,
+                "timestamp": now,
+                "last_access": now
+            })
+            self.index.add(vector)
+            self.dirty = True
+
+    def save(self, path: str, index_version: Optional[int] = None):
+        """Persist the index and entries to ``<path>.index`` / ``<path>.json``
+
+        Each file is written to a temporary path and renamed into place, so a
+        crash never leaves a partially written file. ``load`` rejects a pair
+        whose sizes disagree (a crash between the two renames).
+
+        ``index_version`` identifies the document index the answers came from;
+        ``load`` discards the cache when it no longer matches.
+        """
+        config.ensure_dir(os.path.dirname(path) or ".")
+        suffix = f".{os.getpid()}.tmp"
+        with self._lock:
+            faiss.write_index(self.index, f"{path}.index{suffix}")
+            entries = [{k: v for k, v in entry.items() if k != "vector"} for entry in self.entries]
+            with open(f"{path}.json{suffix}", 'w', encoding='utf-8') as f:
+                json.dump({"index_version": index_version, "entries": entries}, f,
+                          ensure_ascii=False, default=str)
+
+            os.replace(f"{path}.index{suffix}", f"{path}.index")
+            os.replace(f"{path}.json{suffix}", f"{path}.json")
+            self.dirty = False
+
+    def load(self, path: str, index_version: Optional[int] = None) -> bool:
+        """Load a cache saved with ``save``; returns False if none exists or it is stale"""
+        if not (os.path.exists(f"{path}.index") and os.path.exists(f"{path}.json")):
+            return False
+
+        try:
+            index = faiss.read_index(f"{path}.index")
+            with open(f"{path}.json", 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+
+            # Answers from a different document index may be outdated
+            saved_version = saved.get("index_version") if isinstance(saved, dict) else None
+            if saved_version != index_version:
+                logger.info(
+                    f"Ignoring semantic cache at {path}: saved for index version {saved_version}, "
+                    f"current is {index_version}"
+                )
+                return False
+            entries = saved["entries"]
+
+            if index.ntotal != len(entries):
+                logger.warning(
+                    f"Ignoring semantic cache at {path}: index has {index.ntotal} vectors "
+                    f"but {len(entries)} entries"
+                )
+                return False
+
+            vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else []
+            for entry, vector in zip(entries, vectors):
+                entry["vector"] = vector.reshape(1, -1)
+
+            with self._lock:
+                self.index = index
+                self.entries = entries
+                self._expire()
+                self.dirty = False
+
+            logger.info(f"Loaded {len(self.entries)} semantic cache entries from {path}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error loading semantic cache from {path}: {str(e)}")
+            return False
+
+    def clear(self):
+        """Remove all cached entries"""
+        with self._lock:
+            self.entries = []
+            self.index = faiss.IndexFlatIP(self.dimension)
+            self.dirty = True
+
+    def __len__(self) -> int:
+        return len(self.entries)
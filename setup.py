@@ -6,11 +6,28 @@ Handles initial setup, directory creation, and dependency checking
 
 import os
 import sys
+import json
+import time
+import ctypes
+import hashlib
+import shutil
 import subprocess
 import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from io import StringIO
 from pathlib import Path
+import importlib.metadata
 import importlib.util
 
+# Markers that let repeated setup runs skip work that is already done
+SETUP_CACHE_DIR = Path(".setup_cache")
+
+# Per-thread output buffer used while setup steps run concurrently
+_output = threading.local()
+
 def print_colored(message, color="white"):
     """Print colored messages"""
     colors = {
@@ -20,7 +37,31 @@ def print_colored(message, color="white"):
         "blue": "\033[94m",
         "white": "\033[0m"
     }
-    print(f"{colors.get(color, colors['white'])}{message}{colors['white']}")
+    print(f"{colors.get(color, colors['white'])}{message}{colors['white']}",
+          file=getattr(_output, "buffer", None) or sys.stdout)
+
+def _run_buffered(step):
+    """Run a setup step, capturing its output instead of interleaving it"""
+    _output.buffer = StringIO()
+    try:
+        return step(), _output.buffer.getvalue()
+    finally:
+        _output.buffer = None
+
+def run_steps_concurrently(steps):
+    """Run independent setup steps in a thread pool
+    
+    Each step's output is printed as a block when it finishes. Returns the
+    step results in the order the steps were given.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = {executor.submit(_run_buffered, step): step for step in steps}
+        for future in as_completed(futures):
+            result, output = future.result()
+            sys.stdout.write(output)
+            results[futures[future]] = result
+    return [results[step] for step in steps]
 
 def check_python_version():
     """Check if Python version is supported"""
@@ -34,33 +75,86 @@ def check_python_version():
     print_colored(f"✅ Python {sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro} detected", "green")
     return True
 
-def check_system_requirements():
+@lru_cache(maxsize=None)
+def nvidia_gpu_count() -> int:
+    """Count NVIDIA GPUs through the NVML library, or 0 if the driver is absent.
+
+    Loading NVML directly avoids spawning nvidia-smi, which is slow on large
+    nodes and may be missing even when the driver is installed.
+    """
+    library = "nvml.dll" if platform.system() == "Windows" else "libnvidia-ml.so.1"
+    try:
+        nvml = ctypes.CDLL(library)
+    except OSError:
+        return 0
+    
+    if nvml.nvmlInit_v2() != 0:
+        return 0
+    try:
+        count = ctypes.c_uint(0)
+        if nvml.nvmlDeviceGetCount_v2(ctypes.byref(count)) != 0:
+            return 0
+        return count.value
+    finally:
+        nvml.nvmlShutdown()
+
+@dataclass
+class SystemInfo:
+    """Result of the one-off system probe"""
+    os: str
+    free_gb: float
+    has_gpu: bool
+
+# Probe results are reused across setup runs for this long
+SYSTEM_INFO_TTL_SECONDS = 3600
+
+@lru_cache(maxsize=1)
+def _probe_system(force=False):
+    """Probe OS, free disk space and GPU, reusing a recent on-disk result"""
+    cache_file = SETUP_CACHE_DIR / "system.json"
+    
+    if not force:
+        try:
+            if time.time() - cache_file.stat().st_mtime < SYSTEM_INFO_TTL_SECONDS:
+                return SystemInfo(**json.loads(cache_file.read_text()))
+        except (OSError, ValueError, TypeError):
+            pass
+    
+    total, used, free = shutil.disk_usage('.')
+    info = SystemInfo(
+        os=platform.system(),
+        free_gb=free / (1024**3),
+        has_gpu=nvidia_gpu_count() > 0
+    )
+    
+    try:
+        SETUP_CACHE_DIR.mkdir(exist_ok=True)
+        cache_file.write_text(json.dumps(asdict(info)))
+    except OSError:
+        pass
+    
+    return info
+
+def check_system_requirements(force=False):
     """Check system requirements"""
     print_colored("💻 Checking system requirements...", "blue")
     
+    info = _probe_system(force)
+    
     # Check OS
-    system = platform.system()
-    print_colored(f"Operating System: {system}", "white")
+    print_colored(f"Operating System: {info.os}", "white")
     
     # Check available disk space
-    import shutil
-    total, used, free = shutil.disk_usage('.')
-    free_gb = free / (1024**3)
-    print_colored(f"Available disk space: {free_gb:.1f} GB", "white")
+    print_colored(f"Available disk space: {info.free_gb:.1f} GB", "white")
     
-    if free_gb < 10:
+    if info.free_gb < 10:
         print_colored("⚠️ Warning: Less than 10GB free space available", "yellow")
     
     # Check for GPU (CUDA)
-    try:
-        import subprocess
-        result = subprocess.run(['nvidia-smi'], capture_output=True, text=True)
-        if result.returncode == 0:
-            print_colored("✅ NVIDIA GPU detected", "green")
-        else:
-            print_colored("ℹ️ No NVIDIA GPU detected (CPU mode will be used)", "yellow")
-    except FileNotFoundError:
-        print_colored("ℹ️ nvidia-smi not found (CPU mode will be used)", "yellow")
+    if info.has_gpu:
+        print_colored("✅ NVIDIA GPU detected", "green")
+    else:
+        print_colored("ℹ️ No NVIDIA GPU detected (CPU mode will be used)", "yellow")
     
     return True
 
@@ -77,25 +171,46 @@ def create_directories():
     ]
     
     for dir_name in directories:
-        dir_path = Path(dir_name)
-        if not dir_path.exists():
-            dir_path.mkdir(parents=True, exist_ok=True)
-            print_colored(f"✅ Created directory: {dir_name}", "green")
-        else:
-            print_colored(f"ℹ️ Directory already exists: {dir_name}", "white")
+        Path(dir_name).mkdir(parents=True, exist_ok=True)
+        print_colored(f"✅ Ensured directory: {dir_name}", "green")
 
-def install_dependencies():
-    """Install Python dependencies"""
+def install_dependencies(force=False):
+    """Install Python dependencies
+    
+    A pre-resolved requirements.lock (with hashes) is preferred over
+    requirements.txt so pip can skip dependency resolution. Skipped when the
+    requirements file is unchanged since the last successful install into the
+    same interpreter and environment, unless force is set.
+    """
     print_colored("📦 Installing Python dependencies...", "blue")
     
-    if not Path("requirements.txt").exists():
+    lockfile = Path("requirements.lock")
+    requirements = lockfile if lockfile.exists() else Path("requirements.txt")
+    if not requirements.exists():
         print_colored("❌ requirements.txt not found!", "red")
         return False
     
+    # Keyed on the target environment too, so a new venv or interpreter installs
+    req_hash = hashlib.sha256(
+        requirements.read_bytes() + f"\0{sys.executable}\0{sys.prefix}".encode("utf-8")
+    ).hexdigest()
+    marker = SETUP_CACHE_DIR / "req.sha256"
+    if not force and marker.exists() and marker.read_text().strip() == req_hash:
+        print_colored("✅ Dependencies up-to-date (cached)", "green")
+        return True
+    
+    command = [sys.executable, "-m", "pip", "install"]
+    if requirements is lockfile:
+        print_colored(f"Installing pinned dependencies from {lockfile}", "white")
+        command += ["--no-deps", "--require-hashes"]
+    command += ["-r", str(requirements)]
+    
+    env = dict(os.environ, PIP_DISABLE_PIP_VERSION_CHECK="1", PIP_NO_PYTHON_VERSION_WARNING="1")
+    
     try:
-        subprocess.check_call([
-            sys.executable, "-m", "pip", "install", "-r", "requirements.txt"
-        ])
+        subprocess.check_call(command, env=env)
+        SETUP_CACHE_DIR.mkdir(exist_ok=True)
+        marker.write_text(req_hash)
         print_colored("✅ Dependencies installed successfully", "green")
         return True
     except subprocess.CalledProcessError as e:
@@ -110,11 +225,10 @@ def install_system_dependencies():
     
     if system == "Linux":
         print_colored("Installing tesseract for OCR support...", "white")
-        try:
-            # Check if tesseract is already installed
-            subprocess.check_call(["which", "tesseract"], stdout=subprocess.DEVNULL)
+        # Check if tesseract is already installed
+        if shutil.which("tesseract"):
             print_colored("✅ Tesseract already installed", "green")
-        except subprocess.CalledProcessError:
+        else:
             print_colored("ℹ️ Tesseract not found. Please install it manually:", "yellow")
             print_colored("   Ubuntu/Debian: sudo apt-get install tesseract-ocr", "white")
             print_colored("   CentOS/RHEL: sudo yum install tesseract", "white")
@@ -127,6 +241,18 @@ def install_system_dependencies():
         print_colored("ℹ️ For Windows, download tesseract from:", "yellow")
         print_colored("   https://github.com/tesseract-ocr/tesseract", "white")
 
+# Settings every component relies on, with their accepted types
+REQUIRED_CONFIG = {
+    "MODEL_NAME": str,
+    "EMBEDDING_MODEL": str,
+    "CHUNK_SIZE": int,
+    "SUPPORTED_EXTENSIONS": (list, tuple, set, frozenset)
+}
+
+def _type_names(expected):
+    types = expected if isinstance(expected, tuple) else (expected,)
+    return " | ".join(t.__name__ for t in types)
+
 def check_configuration():
     """Check and validate configuration"""
     print_colored("⚙️ Checking configuration...", "blue")
@@ -135,23 +261,24 @@ def check_configuration():
         import config
         print_colored("✅ Configuration file loaded successfully", "green")
         
-        # Check critical config values
-        required_configs = [
-            'MODEL_NAME',
-            'EMBEDDING_MODEL', 
-            'CHUNK_SIZE',
-            'SUPPORTED_EXTENSIONS'
-        ]
+        # Check critical config values and their types in one pass
+        settings = vars(config)
+        problems = []
+        for name, expected in REQUIRED_CONFIG.items():
+            if name not in settings:
+                problems.append(f"config.{name}: missing (expected {_type_names(expected)})")
+            elif not isinstance(settings[name], expected):
+                problems.append(
+                    f"config.{name}: expected {_type_names(expected)}, got {settings[name]!r}"
+                )
         
-        missing_configs = []
-        for config_name in required_configs:
-            if not hasattr(config, config_name):
-                missing_configs.append(config_name)
+        if problems:
+            print_colored("❌ Invalid configuration:", "red")
+            for problem in problems:
+                print_colored(f"   {problem}", "red")
+            return False
         
-        if missing_configs:
-            print_colored(f"⚠️ Missing configurations: {', '.join(missing_configs)}", "yellow")
-        else:
-            print_colored("✅ All required configurations present", "green")
+        print_colored("✅ All required configurations present", "green")
             
         return True
         
@@ -159,18 +286,48 @@ def check_configuration():
         print_colored(f"❌ Failed to import config: {e}", "red")
         return False
 
-def setup_huggingface_token():
-    """Setup Hugging Face token if needed"""
+def _find_huggingface_token():
+    """Return where an existing Hugging Face token was found, or None"""
+    if os.getenv("HUGGINGFACE_TOKEN"):
+        return "HUGGINGFACE_TOKEN environment variable"
+    
+    for token_file in (Path.home() / ".cache" / "huggingface" / "token",
+                       Path.home() / ".huggingface" / "token"):
+        try:
+            if token_file.read_text().strip():
+                return str(token_file)
+        except OSError:
+            pass
+    
+    try:
+        from dotenv import dotenv_values
+        if dotenv_values(".env").get("HUGGINGFACE_TOKEN"):
+            return ".env file"
+    except ImportError:
+        pass
+    
+    return None
+
+def setup_huggingface_token(interactive=True):
+    """Setup Hugging Face token if needed
+    
+    Only prompts when interactive and stdin is a terminal, so unattended
+    runs (CI, Docker builds) never block.
+    """
     print_colored("🤗 Setting up Hugging Face access...", "blue")
     
-    if os.getenv("HUGGINGFACE_TOKEN"):
-        print_colored("✅ HUGGINGFACE_TOKEN environment variable found", "green")
+    source = _find_huggingface_token()
+    if source:
+        print_colored(f"✅ Hugging Face token found in {source}", "green")
         return True
     
     print_colored("ℹ️ No HUGGINGFACE_TOKEN found", "white")
     print_colored("If you need access to private models, set your token:", "white")
     print_colored("   export HUGGINGFACE_TOKEN='your_token_here'", "white")
     
+    if not interactive or not sys.stdin.isatty():
+        return True
+    
     response = input("Do you have a Hugging Face token to set now? (y/n): ").lower()
     if response == 'y':
         token = input("Enter your Hugging Face token: ").strip()
@@ -182,6 +339,20 @@ def setup_huggingface_token():
     
     return True
 
+# Distribution names for critical imports whose import name differs
+_IMPORT_TO_DIST = {
+    "llama_index": "llama_index_core"
+}
+
+def _installed_distributions():
+    """Normalized names of every installed distribution, from one metadata scan"""
+    installed = set()
+    for dist in importlib.metadata.distributions():
+        name = dist.metadata["Name"]
+        if name:
+            installed.add(name.lower().replace("-", "_").replace(".", "_"))
+    return installed
+
 def test_imports():
     """Test critical imports"""
     print_colored("🧪 Testing critical imports...", "blue")
@@ -195,12 +366,17 @@ def test_imports():
         "chromadb"
     ]
     
+    installed = _installed_distributions()
     failed_imports = []
     
     for module_name in critical_imports:
+        if _IMPORT_TO_DIST.get(module_name, module_name) in installed:
+            print_colored(f"  ✅ {module_name}", "green")
+            continue
+        
+        # Not pip-installed under the expected name; fall back to a path lookup
         try:
-            spec = importlib.util.find_spec(module_name)
-            if spec is None:
+            if importlib.util.find_spec(module_name) is None:
                 failed_imports.append(module_name)
             else:
                 print_colored(f"  ✅ {module_name}", "green")
@@ -261,6 +437,14 @@ The RAG system will automatically:
 
 def main():
     """Main setup function"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Set up RAG Assistant")
+    parser.add_argument("--force", action="store_true",
+                        help="Ignore cached setup results and redo every step")
+    parser.add_argument("--non-interactive", action="store_true",
+                        help="Never prompt for input")
+    args = parser.parse_args()
+    
     print_colored("=" * 60, "blue")
     print_colored("🚀 RAG Assistant Setup Script", "blue")
     print_colored("=" * 60, "blue")
@@ -269,35 +453,37 @@ def main():
     if not check_python_version():
         sys.exit(1)
     
-    # Step 2: Check system requirements
-    check_system_requirements()
+    # Steps 2-4: Independent checks and filesystem setup. Sample data
+    # instructions are written into the data directory, so they follow
+    # directory creation within the same task.
+    def create_directories_and_sample_data():
+        create_directories()
+        create_sample_data()
     
-    # Step 3: Create directories
-    create_directories()
-    
-    # Step 4: Install system dependencies
-    install_system_dependencies()
+    run_steps_concurrently([
+        lambda: check_system_requirements(force=args.force),
+        create_directories_and_sample_data,
+        install_system_dependencies
+    ])
     
     # Step 5: Install Python dependencies
-    if not install_dependencies():
+    if not install_dependencies(force=args.force):
         print_colored("❌ Setup failed during dependency installation", "red")
         sys.exit(1)
     
-    # Step 6: Test imports
-    if not test_imports():
+    # Steps 6-7: Test imports and check configuration
+    imports_ok, config_ok = run_steps_concurrently([test_imports, check_configuration])
+    
+    if not imports_ok:
         print_colored("❌ Setup failed during import testing", "red")
         sys.exit(1)
     
-    # Step 7: Check configuration
-    if not check_configuration():
+    if not config_ok:
         print_colored("❌ Setup failed during configuration check", "red")
         sys.exit(1)
     
     # Step 8: Setup Hugging Face token
-    setup_huggingface_token()
-    
-    # Step 9: Create sample data instructions
-    create_sample_data()
+    setup_huggingface_token(interactive=not args.non_interactive)
     
     # Success message
     print_colored("=" * 60, "green")
@@ -1,48 +1,158 @@
 import os
+import re
 import json
 import time
-from pathlib import Path
-from typing import List, Dict, Any, Optional
+import itertools
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Iterator, List, Dict, Any, Mapping, Optional
 from datetime import datetime
+from functools import lru_cache
+import numpy as np
 from loguru import logger
 import config
 
+try:
+    import orjson  # Optional fast JSON encoder
+except ImportError:
+    orjson = None
+
+_SUPPORTED_EXTENSIONS = frozenset(ext.lower() for ext in config.SUPPORTED_EXTENSIONS)
+
+# Local-time ISO 8601 format (second precision) for file modification times
+_ISO_FMT = "%Y-%m-%dT%H:%M:%S"
+
 def setup_logging():
     """Setup logging configuration"""
-    # Create logs directory
-    Path(config.LOGS_DIR).mkdir(parents=True, exist_ok=True)
-    
-    # Configure loguru
+    # Configure loguru. Records are queued to a background writer, which also
+    # does rotation and compression, so logging threads never block on file I/O.
+    # The queue only serializes writers within one process, so every process
+    # (app, CLI, tests) gets its own file named by its start time
     logger.add(
-        os.path.join(config.LOGS_DIR, "rag_app_{time}.log"),
+        os.path.join(config.ensure_dir(config.LOGS_DIR), "rag_app_{time}.log"),
         rotation="10 MB",
         retention="10 days",
+        compression="gz",
+        enqueue=True,
+        buffering=8192,
         level="INFO",
         format="{time} | {level} | {message}"
     )
     
     logger.info("Logging setup completed")
 
+# (divisor, suffix) per power of 1024, indexed by bit_length
+_SIZE_UNITS = ((1024, "KB"), (1024 ** 2, "MB"), (1024 ** 3, "GB"), (1024 ** 4, "TB"))
+
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human readable format"""
-    if size_bytes < 1024:
+    index = (int(size_bytes).bit_length() - 1) // 10
+    if index <= 0:
         return f"{size_bytes} B"
-    elif size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.1f} KB"
-    elif size_bytes < 1024 * 1024 * 1024:
-        return f"{size_bytes / (1024 * 1024):.1f} MB"
-    else:
-        return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
+    divisor, suffix = _SIZE_UNITS[min(index, len(_SIZE_UNITS)) - 1]
+    return f"{size_bytes / divisor:.1f} {suffix}"
+
+def _iter_file_entries(directory_path: str):
+    """Yield a DirEntry for every file below directory_path.
+
+    Walks with ``os.scandir`` so each entry's type (and, after the first
+    ``entry.stat()``, its stat result) is cached on the entry. Unreadable
+    subdirectories are skipped; an unreadable root raises.
+    """
+    pending = [directory_path]
+    root = True
+    
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+        except OSError as e:
+            if root:
+                raise
+            logger.warning("Cannot scan directory: {}", e)
+        root = False
+
+def _stat_entry(entry: os.DirEntry) -> Optional[os.stat_result]:
+    """Stat one entry, or None if it vanished or cannot be read"""
+    try:
+        return entry.stat()
+    except OSError as e:
+        logger.warning("Cannot stat file, skipping: {} ({})", entry.path, e)
+        return None
+
+def _stat_entries(entries: List[os.DirEntry]) -> List[Optional[os.stat_result]]:
+    """Stat directory entries, overlapping the syscalls for large scans.
+
+    Each worker stats one contiguous slice, so a scan costs a handful of task
+    submissions rather than one per file. On cold metadata (network or
+    spinning disks) the stats then wait on I/O concurrently. Entries that
+    cannot be statted yield None.
+    """
+    workers = config.SCAN_STAT_WORKERS
+    if len(entries) < config.SCAN_PARALLEL_STAT_MIN or workers <= 1:
+        return [_stat_entry(entry) for entry in entries]
+    
+    step = -(-len(entries) // workers)
+    slices = [entries[start:start + step] for start in range(0, len(entries), step)]
+    with ThreadPoolExecutor(max_workers=len(slices)) as executor:
+        results = executor.map(lambda part: [_stat_entry(entry) for entry in part], slices)
+        return [stat for part in results for stat in part]
+
+# Directory scan results keyed by path: (directory mtime, scanned at, info)
+_directory_info_cache: Dict[str, tuple] = {}
 
 def get_directory_info(directory_path: str) -> Dict[str, Any]:
-    """Get information about files in a directory"""
-    directory = Path(directory_path)
+    """Get information about files in a directory.
+
+    Results are reused while the directory's own mtime is unchanged (files added
+    or removed) and the entry is younger than DIRECTORY_INFO_CACHE_SECONDS, which
+    bounds staleness for changes deeper in the tree.
+    """
+    try:
+        dir_mtime = os.path.getmtime(directory_path)
+    except OSError:
+        return _scan_directory(directory_path)
+    
+    cache_key = os.path.abspath(directory_path)
+    cached = _directory_info_cache.get(cache_key)
+    if cached:
+        cached_mtime, scanned_at, info = cached
+        if cached_mtime == dir_mtime and time.time() - scanned_at < config.DIRECTORY_INFO_CACHE_SECONDS:
+            return info
     
-    if not directory.exists():
-        return {"error": f"Directory does not exist: {directory_path}"}
+    info = _scan_directory(directory_path)
+    if "error" not in info:
+        _directory_info_cache[cache_key] = (dir_mtime, time.time(), info)
+    return info
+
+def invalidate_directory_info(directory_path: Optional[str] = None):
+    """Drop cached scans covering a directory (or every cached scan).
+
+    Write paths call this so changes that leave a scanned directory's own mtime
+    untouched (overwrites, nested files) are visible on the next scan. Scans of
+    the directory and of any of its ancestors are dropped.
+    """
+    if directory_path is None:
+        _directory_info_cache.clear()
+        return
+    
+    path = os.path.abspath(directory_path)
+    for cached_path in list(_directory_info_cache):
+        if path == cached_path or path.startswith(cached_path.rstrip(os.sep) + os.sep):
+            _directory_info_cache.pop(cached_path, None)
+
+def _scan_directory(directory_path: str) -> Dict[str, Any]:
+    """Walk a directory and collect file statistics"""
+    directory = os.path.normpath(directory_path)
     
     info = {
-        "path": str(directory),
+        "path": directory,
         "exists": True,
         "total_files": 0,
         "supported_files": 0,
@@ -52,30 +162,43 @@ def get_directory_info(directory_path: str) -> Dict[str, Any]:
     }
     
     try:
-        for file_path in directory.rglob("*"):
-            if file_path.is_file():
-                info["total_files"] += 1
-                file_size = file_path.stat().st_size
-                info["total_size"] += file_size
-                
-                file_ext = file_path.suffix.lower()
-                info["file_types"][file_ext] = info["file_types"].get(file_ext, 0) + 1
-                
-                if file_ext in config.SUPPORTED_EXTENSIONS:
-                    info["supported_files"] += 1
-                    info["files"].append({
-                        "name": file_path.name,
-                        "path": str(file_path),
-                        "extension": file_ext,
-                        "size": file_size,
-                        "size_formatted": format_file_size(file_size),
-                        "modified": datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
-                    })
+        try:
+            entries = list(_iter_file_entries(directory))
+        except FileNotFoundError:
+            return {"error": f"Directory does not exist: {directory_path}"}
+        # One stat per file; drop files that could not be statted
+        stated = [(entry, stat) for entry, stat in zip(entries, _stat_entries(entries)) if stat is not None]
+        entries = [entry for entry, _ in stated]
+        stats = [stat for _, stat in stated]
+        splitext = os.path.splitext
+        extensions = [splitext(entry.name)[1].lower() for entry in entries]
+        
+        # Aggregate in C rather than updating counters per file
+        info["total_files"] = len(entries)
+        info["total_size"] = int(np.fromiter((stat.st_size for stat in stats), dtype=np.int64, count=len(stats)).sum())
+        info["file_types"] = dict(Counter(extensions))
+        
+        # Bind globals and attributes used per file to locals
+        supported, iso_fmt = _SUPPORTED_EXTENSIONS, _ISO_FMT
+        fmt_size, strftime, localtime = format_file_size, time.strftime, time.localtime
+        info["files"] = [
+            {
+                "name": entry.name,
+                "path": entry.path,
+                "extension": file_ext,
+                "size": stat.st_size,
+                "size_formatted": fmt_size(stat.st_size),
+                "modified": strftime(iso_fmt, localtime(stat.st_mtime))
+            }
+            for entry, stat, file_ext in zip(entries, stats, extensions)
+            if file_ext in supported
+        ]
+        info["supported_files"] = len(info["files"])
         
         info["total_size_formatted"] = format_file_size(info["total_size"])
         
     except Exception as e:
-        logger.error(f"Error scanning directory {directory_path}: {str(e)}")
+        logger.error("Error scanning directory {}: {}", directory_path, e)
         info["error"] = str(e)
     
     return info
@@ -90,20 +213,22 @@ def validate_file_upload(file_path: str) -> Dict[str, Any]:
     }
     
     try:
-        file_path_obj = Path(file_path)
+        # Check file extension first; rejected uploads never touch the disk
+        file_name = os.path.basename(file_path)
+        file_ext = os.path.splitext(file_name)[1].lower()
+        if file_ext not in _SUPPORTED_EXTENSIONS:
+            validation["errors"].append(f"Unsupported file type: {file_ext}")
+            return validation
         
-        # Check if file exists
-        if not file_path_obj.exists():
+        # Check if file exists; the same stat supplies the size below
+        try:
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
             validation["errors"].append("File does not exist")
             return validation
         
-        # Check file extension
-        file_ext = file_path_obj.suffix.lower()
-        if file_ext not in config.SUPPORTED_EXTENSIONS:
-            validation["errors"].append(f"Unsupported file type: {file_ext}")
-        
         # Check file size
-        file_size = file_path_obj.stat().st_size
+        file_size = file_stat.st_size
         file_size_mb = file_size / (1024 * 1024)
         
         if file_size_mb > config.MAX_FILE_SIZE_MB:
@@ -113,7 +238,7 @@ def validate_file_upload(file_path: str) -> Dict[str, Any]:
         
         # File info
         validation["info"] = {
-            "name": file_path_obj.name,
+            "name": file_name,
             "extension": file_ext,
             "size": file_size,
             "size_formatted": format_file_size(file_size),
@@ -146,72 +271,107 @@ Answer:"""
     
     return prompt
 
+# Boilerplate answer prefixes, possibly chained (e.g. "Answer: Based on the context").
+# "Answer"/"Response" are only labels when followed by a colon, so answers that
+# merely start with those words ("Response times are...") are left intact.
+_ANSWER_PREFIX_RE = re.compile(
+    r"^(?:(?:(?:answer|response)\s*:|(?:based on the context|according to the information provided)\b\s*:?)\s*)+",
+    re.IGNORECASE
+)
+
 def extract_answer_from_response(response: str) -> str:
     """Extract clean answer from model response"""
-    # Remove common prefixes
-    prefixes_to_remove = [
-        "Answer:",
-        "Response:",
-        "Based on the context",
-        "According to the information provided"
-    ]
-    
-    cleaned_response = response.strip()
-    
-    for prefix in prefixes_to_remove:
-        if cleaned_response.lower().startswith(prefix.lower()):
-            cleaned_response = cleaned_response[len(prefix):].strip()
-            if cleaned_response.startswith(":"):
-                cleaned_response = cleaned_response[1:].strip()
-    
-    return cleaned_response
+    return _ANSWER_PREFIX_RE.sub("", response.strip(), count=1)
+
+def _format_source(i: int, source: Dict[str, Any]) -> str:
+    """Format one source line for display"""
+    metadata = source.get("metadata", {})
+    chunk_id = metadata.get("chunk_id", "")
+    # chunk_id 0 is a real chunk, so only the missing value is omitted
+    chunk_label = f" (chunk {chunk_id})" if chunk_id != "" else ""
+    return (
+        f"**Source {i}:** {metadata.get('file_name', 'Unknown')}{chunk_label}"
+        f" (similarity: {source.get('score', 0.0):.3f})"
+    )
 
 def format_sources(sources: List[Dict[str, Any]]) -> str:
     """Format source documents for display"""
     if not sources:
         return "No sources found."
     
-    formatted_sources = []
-    for i, source in enumerate(sources, 1):
-        metadata = source.get("metadata", {})
-        file_name = metadata.get("file_name", "Unknown")
-        chunk_id = metadata.get("chunk_id", "")
-        score = source.get("score", 0.0)
-        
-        formatted_sources.append(
-            f"**Source {i}:** {file_name}"
-            f"{f' (chunk {chunk_id})' if chunk_id != '' else ''}"
-            f" (similarity: {score:.3f})"
-        )
-    
-    return "\n".join(formatted_sources)
+    return "\n".join(_format_source(i, source) for i, source in enumerate(sources, 1))
+
+def _chat_line(turn: Dict[str, Any]) -> bytes:
+    """Serialize one chat turn as a JSONL line"""
+    if orjson is not None:
+        return orjson.dumps(turn, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(turn, ensure_ascii=False) + "\n").encode("utf-8")
+
+def _write_bytes(filepath: str, data: bytes, flags: int):
+    """Write bytes straight to a file descriptor, bypassing buffered IO"""
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | flags, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
 
 def save_chat_history(chat_history: List[Dict[str, str]], filename: Optional[str] = None):
-    """Save chat history to JSON file"""
+    """Save chat history to a JSONL file, one turn per line"""
     if not filename:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"chat_history_{timestamp}.json"
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        filename = f"chat_history_{timestamp}.jsonl"
     
-    filepath = os.path.join(config.LOGS_DIR, filename)
+    filepath = os.path.join(config.ensure_dir(config.LOGS_DIR), filename)
     
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(chat_history, f, indent=2, ensure_ascii=False)
-        logger.info(f"Chat history saved to {filepath}")
+        _write_bytes(filepath, b"".join(_chat_line(turn) for turn in chat_history), os.O_TRUNC)
+        invalidate_directory_info(config.LOGS_DIR)
+        logger.info("Chat history saved to {}", filepath)
         return filepath
     except Exception as e:
-        logger.error(f"Error saving chat history: {str(e)}")
+        logger.error("Error saving chat history: {}", e)
         return None
 
+def append_chat_turn(turn: Dict[str, Any], filepath: Optional[str] = None) -> Optional[str]:
+    """Append a single chat turn to the JSONL chat log"""
+    filepath = filepath or config.CHAT_LOG_PATH
+    
+    try:
+        config.ensure_dir(os.path.dirname(filepath) or ".")
+        # One O_APPEND write of one complete line, so concurrent appends do not interleave
+        _write_bytes(filepath, _chat_line(turn), os.O_APPEND)
+        return filepath
+    except Exception as e:
+        logger.error("Error appending chat turn: {}", e)
+        return None
+
+def iter_chat_history(filepath: str) -> Iterator[Dict[str, Any]]:
+    """Stream chat turns from a JSONL file.
+
+    Files saved as a single JSON array by older versions are still read.
+    """
+    loads = orjson.loads if orjson is not None else json.loads
+    
+    with open(filepath, 'rb') as f:
+        first_line = f.readline()
+        if first_line.lstrip().startswith(b"["):
+            yield from loads(first_line + f.read())
+            return
+        
+        for line in itertools.chain((first_line,), f):
+            if line.strip():
+                yield loads(line)
+
 def load_chat_history(filepath: str) -> List[Dict[str, str]]:
-    """Load chat history from JSON file"""
+    """Load chat history from a JSONL (or legacy JSON) file"""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            chat_history = json.load(f)
-        logger.info(f"Chat history loaded from {filepath}")
+        chat_history = list(iter_chat_history(filepath))
+        logger.info("Chat history loaded from {}", filepath)
         return chat_history
     except Exception as e:
-        logger.error(f"Error loading chat history: {str(e)}")
+        logger.error("Error loading chat history: {}", e)
         return []
 
 def estimate_processing_time(file_size_mb: float) -> str:
@@ -248,49 +408,71 @@ def create_system_info() -> Dict[str, Any]:
     }
 
 def cleanup_old_logs(days_to_keep: int = 7):
-    """Clean up old log files"""
+    """Clean up old log files, including rotated and compressed ones"""
     try:
-        logs_dir = Path(config.LOGS_DIR)
-        if not logs_dir.exists():
+        # Integer nanoseconds avoid float rounding near the cutoff
+        cutoff_ns = time.time_ns() - days_to_keep * 86_400 * 1_000_000_000
+        
+        # One scandir pass; each entry's stat result is cached on the entry
+        try:
+            with os.scandir(config.LOGS_DIR) as entries:
+                stale = [
+                    entry.path for entry in entries
+                    if entry.name.endswith((".log", ".log.gz"))
+                    and entry.is_file()
+                    and entry.stat().st_mtime_ns < cutoff_ns
+                ]
+        except FileNotFoundError:
             return
         
-        cutoff_time = time.time() - (days_to_keep * 24 * 60 * 60)
+        for log_path in stale:
+            os.unlink(log_path)
+            logger.info("Deleted old log file: {}", log_path)
         
-        for log_file in logs_dir.glob("*.log"):
-            if log_file.stat().st_mtime < cutoff_time:
-                log_file.unlink()
-                logger.info(f"Deleted old log file: {log_file}")
+        if stale:
+            invalidate_directory_info(config.LOGS_DIR)
                 
     except Exception as e:
-        logger.error(f"Error cleaning up old logs: {str(e)}")
+        logger.error("Error cleaning up old logs: {}", e)
 
-def check_system_requirements() -> Dict[str, Any]:
-    """Check if system meets requirements"""
-    requirements = {
-        "status": "checking",
-        "errors": [],
-        "warnings": [],
-        "info": {}
-    }
+@lru_cache(maxsize=1)
+def _probe_system() -> Mapping[str, Any]:
+    """Probe torch/CUDA and free disk space once per process"""
+    info = {}
     
     try:
         import torch
-        requirements["info"]["torch_available"] = True
-        requirements["info"]["cuda_available"] = torch.cuda.is_available()
+        info["torch_available"] = True
+        info["cuda_available"] = torch.cuda.is_available()
         
         if torch.cuda.is_available():
-            requirements["info"]["cuda_device_count"] = torch.cuda.device_count()
-            requirements["info"]["cuda_device_name"] = torch.cuda.get_device_name()
+            info["cuda_device_count"] = torch.cuda.device_count()
+            info["cuda_device_name"] = torch.cuda.get_device_name()
         
     except ImportError:
-        requirements["warnings"].append("PyTorch not available - CPU only mode")
+        info["torch_available"] = False
     
     # Check available disk space
-    import shutil
-    total, used, free = shutil.disk_usage(config.MODEL_PATH)
-    free_gb = free / (1024**3)
+    total, used, free = shutil.disk_usage(config.ensure_dir(config.MODEL_PATH))
+    info["free_disk_space_gb"] = free / (1024**3)
+    
+    # Read-only, so callers cannot alter the cached result
+    return MappingProxyType(info)
+
+def check_system_requirements() -> Dict[str, Any]:
+    """Check if system meets requirements"""
+    requirements = {
+        "status": "checking",
+        "errors": [],
+        "warnings": [],
+        "info": dict(_probe_system())
+    }
+    
+    if not requirements["info"]["torch_available"]:
+        del requirements["info"]["torch_available"]
+        requirements["warnings"].append("PyTorch not available - CPU only mode")
     
-    requirements["info"]["free_disk_space_gb"] = free_gb
+    free_gb = requirements["info"]["free_disk_space_gb"]
     
     if free_gb < 10:
         requirements["errors"].append(f"Low disk space: {free_gb:.1f} GB free")
@@ -303,4 +485,4 @@ def check_system_requirements() -> Dict[str, Any]:
             requirements["warnings"].append(f"Directory does not exist: {dir_path}")
     
     requirements["status"] = "completed"
-    return requirements
\ No newline at end of file
+    return requirements